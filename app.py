@@ -1,447 +1,116 @@
+import os
+
 import pandas as pd
 import streamlit as st
 import plotly.express as px
 
+from downsampling import MAX_POINTS, downsample
+from profiling import PROFILE_ENABLED, PROFILE_FLAG, StageProfiler, activate, stage
+from stroke_metrics import (
+    ERRO,
+    NUMERIC_METRICS,
+    SESSION_KEYS,
+    STROKE_SERIES_METRICS,
+    VALIDATION_RULES,
+    SegmentGrid,
+    iter_csv_files,
+    label_anomaly_rows,
+    read_events,
+    results_long_table,
+    session_hash,
+    smooth_stroke_series,
+    stored_session_results,
+)
+from report_export import EXPORT_FORMATS, export_bytes
+from session_db import DEFAULT_DB_PATH, SessionDatabase
+from session_store import DEFAULT_STORE, list_sessions, load_sessions, partition_signature
+from squad_stats import bootstrap_paired, duplicate_sessions
+from streaming import CsvTail, StreamingIngestor
+
 st.set_page_config(layout="wide")
 
-# Função para estimar tempos nos pontos de interesse
-def estimate_time_at_positions(df, positions):
-    estimated_times = {pos: None for pos in positions}
-    estimated_200 = 0
-    for i in range(1, len(df)):
-        current_pos = df.iloc[i]['Distância']
-        previous_pos = df.iloc[i - 1]['Distância']
-        if current_pos == 200:
-            estimated_200 = (
-                df.iloc[i - 1]['Min'] * 60 +
-                df.iloc[i - 1]['Segundo'] +
-                df.iloc[i - 1]['Milesimos'] / 1000
-            )            
-        if previous_pos < current_pos:
-            for pos in positions:
-                if previous_pos <= pos <= current_pos and estimated_times[pos] is None:
-                    time_prev = (
-                        df.iloc[i - 1]['Min'] * 60 +
-                        df.iloc[i - 1]['Segundo'] +
-                        df.iloc[i - 1]['Milesimos'] / 1000
-                    )
-                    time_current = (
-                        df.iloc[i]['Min'] * 60 +
-                        df.iloc[i]['Segundo'] +
-                        df.iloc[i]['Milesimos'] / 1000
-                    )
-                    estimated_time = (
-                        time_prev +
-                        (pos - previous_pos) * (time_current - time_prev) / (current_pos - previous_pos)
-                    )
-                    estimated_times[pos] = estimated_time
-
-    estimated_times[200] = estimated_200
-    return estimated_times
-
-
-def calculate_phases_with_total_times_and_percentages(df, trecho_positions, estimated_times):
-    """
-    Calcula o tempo total das fases aérea e aquática, dividindo os tempos entre os trechos,
-    calcula os percentuais de cada fase em cada trecho, além dos totais e percentuais gerais
-    para cada fase (aérea e aquática).
-
-    Args:
-        df (pd.DataFrame): DataFrame contendo os dados de remadas.
-        trecho_positions (list): Lista ordenada das posições que delimitam os trechos.
-        estimated_times (dict): Dicionário com os tempos estimados para cada posição.
-
-    Returns:
-        tuple: Quatro dicionários contendo:
-            1. Tempo total das fases aérea e aquática por trecho.
-            2. Percentuais das fases aérea e aquática por trecho.
-            3. Tempo total das fases aérea e aquática no total (sem divisão por trecho).
-            4. Percentual total das fases aérea e aquática (sem divisão por trecho).
-    """
-    # Inicializar tempos totais por trecho
-    trecho_positions = [0, 25, 50, 75, 100, 125, 150, 175, 200]
-    # Inicializar tempos totais por trecho
-    air_phase_times = {trecho_positions[i]: 0 for i in range(len(trecho_positions) - 1)}
-    water_phase_times = {trecho_positions[i]: 0 for i in range(len(trecho_positions) - 1)}
-
-    # Inicializar tempos totais por trecho para o cálculo de percentuais
-    total_trecho_times = {trecho_positions[i]: 0 for i in range(len(trecho_positions) - 1)}
-
-    # Inicializar variáveis para os tempos totais gerais
-    total_air_time = 0
-    total_water_time = 0
-    total_time = 0
-
-    for i in range(1, len(df)):
-        # Determinar a fase atual
-        current_action = df.iloc[i - 1]['Ação']
-        next_action = df.iloc[i]['Ação']
-
-        # Determinar os tempos do início e fim do intervalo
-        start_time = (df.iloc[i - 1]['Min'] * 60 +
-                      df.iloc[i - 1]['Segundo'] +
-                      df.iloc[i - 1]['Milesimos'] / 1000)
-        end_time = (df.iloc[i]['Min'] * 60 +
-                    df.iloc[i]['Segundo'] +
-                    df.iloc[i]['Milesimos'] / 1000)
-
-        # Determinar a distância do início e fim do intervalo
-        start_dist = df.iloc[i - 1]['Distância']
-        end_dist = df.iloc[i]['Distância']
-
-        # Identificar o tipo de fase
-        if current_action == 'Saida' and next_action == 'Entrada':
-            phase_type = "Fase Aérea"
-        elif current_action == 'Entrada' and next_action == 'Saida':
-            phase_type = "Fase Aquática"
-        else:
-            print('INVALIDA')
-            continue  # Ignorar ações que não correspondem a uma fase válida
-
-        # Dividir o tempo entre trechos, se necessário
-        trecho_keys = sorted(trecho_positions)
-        trecho_started = False
-        for j in range(len(trecho_keys) - 1):
-            trecho_start = trecho_keys[j]
-            trecho_end = trecho_keys[j + 1]
-
-            if start_dist < trecho_end and end_dist > trecho_start:
-                # Calcular a proporção de tempo no trecho
-                overlap_start = max(start_dist, trecho_start)
-                overlap_end = min(end_dist, trecho_end)
-
-                if overlap_start < overlap_end:  # Verificar se há sobreposição
-                    trecho_duration = (overlap_end - overlap_start) * (end_time - start_time) / (end_dist - start_dist)
-                    trecho_label = f"{trecho_start}-{trecho_end}m"
-
-                    # Atualizar o tempo total no trecho
-                    total_trecho_times[trecho_start] += trecho_duration
-
-                    # Atualizar o dicionário correspondente
-                    if phase_type == "Fase Aérea":
-                        air_phase_times[trecho_start] += trecho_duration
-                        total_air_time += trecho_duration
-                    elif phase_type == "Fase Aquática":
-                        water_phase_times[trecho_start] += trecho_duration
-                        total_water_time += trecho_duration
-
-                    # Atualizar o tempo total geral
-                    total_time += trecho_duration
-
-                    trecho_started = True
-
-        # Caso o remador permaneça no mesmo trecho sem transição
-        if not trecho_started:
-            # Se o remador não transitar de trecho, conta o tempo para o trecho atual
-            current_trecho = trecho_start
-            
-            trecho_duration = (end_time - start_time)
-            
-            total_trecho_times[current_trecho] += trecho_duration
-
-            if phase_type == "Fase Aérea":
-                air_phase_times[current_trecho] += trecho_duration
-                total_air_time += trecho_duration
-            elif phase_type == "Fase Aquática":
-                water_phase_times[current_trecho] += trecho_duration
-                total_water_time += trecho_duration
-            total_time += trecho_duration
-
-    # Calcular os percentuais para cada fase em cada trecho
-    air_phase_percentages = {key: (air_phase_times[key] / total_trecho_times[key]) * 100
-                             if total_trecho_times[key] > 0 else 0
-                             for key in air_phase_times}
-    
-    water_phase_percentages = {key: (water_phase_times[key] / total_trecho_times[key]) * 100
-                               if total_trecho_times[key] > 0 else 0
-                               for key in water_phase_times}
+# Nomes exibidos para os rótulos da coluna 'Teste'
+TEST_LABELS = {'Pre': 'Pré-Teste', 'Pos': 'Pós-Teste'}
 
-    # Calcular os percentuais gerais para as fases
-    total_air_percentage = (total_air_time / total_time) * 100 if total_time > 0 else 0
-    total_water_percentage = (total_water_time / total_time) * 100 if total_time > 0 else 0
+# Distâncias de prova e resoluções de trecho disponíveis na interface
+RACE_DISTANCES = [200, 500, 1000]
+SEGMENT_STEPS = [5, 10, 25, 50]
 
-    return air_phase_times, water_phase_times, air_phase_percentages, water_phase_percentages, total_air_time, total_water_time, total_air_percentage, total_water_percentage
 
+# Variáveis exibidas ao abrir a página e altura de cada painel do gráfico comparativo
+DEFAULT_CHART_VARIABLES = ['Vel Média (m/s)', 'Freq de Rem (r/min)']
+CHART_ROW_HEIGHT = 280
 
-def calculate_cycles_and_lost_strokes(df, trecho_positions):
-    """
-    Calcula os ciclos de remada e as remadas perdidas, atribuindo os ciclos aos trechos
-    com base na maior distância percorrida dentro do trecho.
+# Janela padrão (em remadas) da média móvel da série por remada
+STROKE_WINDOW = 5
 
-    Args:
-        df (pd.DataFrame): DataFrame contendo os dados de remadas.
-        trecho_positions (dict): Dicionário cujas chaves representam os limites dos trechos (ex.: {0: 'Trecho 1', 25: 'Trecho 2', ...}).
+# Reamostragens do bootstrap da comparação Pré x Pós do grupo
+BOOTSTRAP_RESAMPLES = 10_000
 
-    Returns:
-        int: Total de ciclos de remada.
-        int: Total de remadas perdidas.
-        dict: Dicionário com a quantidade de ciclos atribuída a cada trecho.
-    """
-    # Inicializar contadores
-    trecho_ciclos = {trecho: 0 for trecho in trecho_positions.values()}
-    cycles = 0
-    lost_strokes = 0
-    used_indices = set()  # Para rastrear as remadas já usadas em ciclos
-
-    i = 0
-    while i < len(df) - 1:
-        # Verificar se a remada atual forma um ciclo válido com a próxima
-        if (
-            df.iloc[i]['Ação'] == 'Entrada'
-            and df.iloc[i + 1]['Ação'] == 'Saida'
-            and i not in used_indices
-        ):
-            current_side = df.iloc[i]['Pá do remo']  # Identifica o lado da remada
-
-            # Verificar se a próxima remada é do lado oposto
-            if i + 3 < len(df) and df.iloc[i + 2]['Ação'] == 'Entrada' and df.iloc[i + 3]['Ação'] == 'Saida':
-                if df.iloc[i + 2]['Pá do remo'] != current_side:
-                    # Encontrou um ciclo: uma remada de cada lado consecutivas
-                    cycles += 1
-                    # Marcar essas remadas como usadas
-                    used_indices.update({i, i + 1, i + 2, i + 3})
-
-                    # Identificar as distâncias de início e fim do ciclo
-                    start_dist = df.iloc[i]['Distância']
-                    end_dist = df.iloc[i + 3]['Distância']
-
-                    # Determinar qual trecho teve a maior sobreposição com o ciclo
-                    max_overlap = 0
-                    assigned_trecho = None
-                    trecho_keys = sorted(trecho_positions.keys())  # Ordenar limites dos trechos
-                    for j in range(len(trecho_keys)):
-                        trecho_start = trecho_keys[j]
-                        if trecho_start == 175:
-                            trecho_end = 200
-                        else:
-                            trecho_end = trecho_keys[j + 1]
-                        if start_dist < trecho_end and end_dist > trecho_start:
-                            # Cálculo da sobreposição do ciclo com o trecho
-                            trecho_overlap = min(end_dist, trecho_end) - max(start_dist, trecho_start)
-                            if trecho_overlap > max_overlap:
-                                max_overlap = trecho_overlap
-                                assigned_trecho = trecho_positions[trecho_start]
-
-                    if assigned_trecho:
-                        trecho_ciclos[assigned_trecho] += 1
-
-                    i += 4  # Avançar após o ciclo
-                    continue
-
-        # Caso não tenha encontrado um ciclo, marcar como remada perdida
-        if i not in used_indices:
-            lost_strokes += 1
-            i += 2  # Saltar 2 porque contamos a remada de entrada e saída como perdida
-        else:
-            i += 1  # Caso a remada já tenha sido usada em outro ciclo, continuar para a próxima
-    return cycles, lost_strokes, trecho_ciclos
-
-
-def calculate_metrics_by_trecho(df, trecho_positions):
-    positions = sorted(trecho_positions.keys())
-    metrics = {
-        'Trecho': [],
-        'Ciclos': [],
-        'Remadas': [], 
-        'Rem Esq': [],
-        'Rem Dir': [],
-        '% Rem Esq': [],
-        '% Rem Dir': [],
-        'Vel Média (m/s)': [],
-
-        'Freq de Rem (r/min)' : [],
-        'Comp Médio Rem (m/remada)': [],
-        'Índice de Remada': [],
-
-        'Freq de Ciclo (r/min)' : [],
-        'Comp Médio Ciclo (m/ciclo)': [],
-        'Índice de Ciclo': [],
-
-        'Tempo (s)': [],        
-        'Fase aérea': [],
-        'Fase aquática': [],
-        'Fase aérea %' : [],
-        'Fase aquática %': [],
-    }
-    
-    totais = {
-        'Trecho': [],
-        'Ciclos': [],
-        'Remadas': [], 
-        'Rem Esq': [],
-        'Rem Dir': [],
-        '% Rem Esq': [],
-        '% Rem Dir': [],
-        'Vel Média (m/s)': [],
-        'Freq de Rem (r/min)' : [],
-        'Comp Médio Rem (m/remada)': [],
-        'Índice de Remada': [],
-
-        'Freq de Ciclo (r/min)' : [],
-        'Comp Médio Ciclo (m/ciclo)': [],
-        'Índice de Ciclo': [],
-
-        'Tempo (s)': [],        
-        'Fase aérea': [],
-        'Fase aquática': [],
-        'Fase aérea %' : [],
-        'Fase aquática %': [],
+# Nomes dos formatos de exportação na interface
+EXPORT_LABELS = {
+    'xlsx': 'Excel (uma planilha por atleta)',
+    'parquet': 'Parquet (.zip)',
+    'csv': 'CSV (.zip)',
+}
 
-    }
-    
+EXPORT_MIME_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'zip': 'application/zip',
+}
 
-    total_cycles, total_lost_strokes, trecho_ciclos = calculate_cycles_and_lost_strokes(df, trecho_positions)
-    estimated_times = estimate_time_at_positions(df, positions)
-
-    fase_aerea, fase_aquatica, fase_aerea_per, fase_aquatica_per, fase_aerea_total, fase_aquatica_total, fase_aerea_total_per, fase_aquatica_total_per = calculate_phases_with_total_times_and_percentages(df, trecho_positions, estimated_times) 
-
-    total_remadas = 0
-    total_ciclos = 0
-    total_tempo = 0
-    total_distancia = 0
-    total_perdidas = 0
-    i = 0
-    for start, label in trecho_positions.items():
-        ciclos = trecho_ciclos.get(label, 0)
-
-        metrics['Trecho'].append(label)
-        metrics['Ciclos'].append(ciclos)
-
-        if start == 175:
-            end = 200
-        else: 
-            end = positions[i + 1]
-        trecho_label = f'{start}-{end}m'
-
-        # Filtrar os dados para cada trecho
-        trecho_df = df[(df['Distância'] >= start) & (df['Distância'] <= end)]  # Ajuste na filtragem
-
-        if trecho_df.empty:  # Verificação adicional se o DataFrame está vazio
-            print(f"Aviso: Não há dados para o trecho {trecho_label}")
-            continue  # Pular para o próximo trecho, se o DataFrame estiver vazio
-
-        remadas = len(trecho_df[trecho_df['Ação'] == 'Saida'])
-        remadas_esquerda = len(trecho_df[(trecho_df['Ação'] == 'Saida') & (trecho_df['Pá do remo'] == 'Esquerda')])
-        remadas_direita = len(trecho_df[(trecho_df['Ação'] == 'Saida') & (trecho_df['Pá do remo'] == 'Direita')])
-
-        tempo_start = estimated_times[start]
-        tempo_end = estimated_times[end]
-
-        tempo = tempo_end - tempo_start
-        distancia = end - start
-        if tempo > 0:
-            velocidade_media = distancia / tempo
-            frequencia_remadas = 60 * (remadas / tempo )
-            frequencia_ciclos = 60 * (ciclos / tempo)
-        else:
-            velocidade_media = 0
-            frequencia_remadas = 0
-            frequencia_ciclos = 0
-
-        comprimento_remada = distancia / remadas if remadas > 0 else 0
-        comprimento_ciclo = distancia / ciclos if ciclos > 0 else 0
-
-        indice_remada = velocidade_media * comprimento_remada
-        indice_ciclos = velocidade_media * comprimento_ciclo
-
-
-
-        perc_esquerda = (remadas_esquerda / remadas) * 100 if remadas > 0 else 0
-        perc_direita = (remadas_direita / remadas) * 100 if remadas > 0 else 0
-        total_acoes = len(trecho_df)
-
-        metrics['Remadas'].append(remadas)
-        metrics['Rem Esq'].append(remadas_esquerda)
-        metrics['Rem Dir'].append(remadas_direita)
-
-        metrics['Vel Média (m/s)'].append(velocidade_media)
-        metrics['Tempo (s)'].append(tempo)
-        metrics['Freq de Rem (r/min)'].append(frequencia_remadas)
-        metrics['Comp Médio Rem (m/remada)'].append(comprimento_remada)
-        metrics['Índice de Remada'].append(indice_remada)
-        metrics['% Rem Esq'].append(perc_esquerda)
-        metrics['% Rem Dir'].append(perc_direita)
-
-        metrics['Freq de Ciclo (r/min)'].append(frequencia_ciclos)
-        metrics['Comp Médio Ciclo (m/ciclo)'].append(comprimento_ciclo)
-        metrics['Índice de Ciclo'].append(indice_ciclos)
-        metrics['Fase aérea'].append(fase_aerea[start])
-        metrics['Fase aquática'].append(fase_aquatica[start])
-        metrics['Fase aérea %'].append(fase_aerea_per[start])
-        metrics['Fase aquática %'].append(fase_aquatica_per[start])
-        
-        # metrics['Ações Totais'].append(total_acoes)
-
-        total_remadas += remadas
-        total_ciclos += ciclos
-        total_tempo += tempo
-        total_distancia += distancia
-        i+=1
-
-    # Adicionar totais
-    totais['Trecho'].append('0-200m')
-    totais['Ciclos'].append(total_ciclos)
-    totais['Remadas'].append(total_remadas)
-    totais['Rem Esq'].append(sum(metrics['Rem Esq']))
-    totais['Rem Dir'].append(sum(metrics['Rem Dir']))
-    totais['Vel Média (m/s)'].append(total_distancia / total_tempo if total_tempo > 0 else 0)
-    totais['Tempo (s)'].append(total_tempo)
-    totais['Freq de Rem (r/min)'].append((total_remadas / total_tempo * 60) if total_tempo > 0 else 0)
-    totais['Comp Médio Rem (m/remada)'].append(total_distancia / total_remadas if total_remadas > 0 else 0)
-    totais['Índice de Remada'].append(totais['Vel Média (m/s)'][-1] * totais['Comp Médio Rem (m/remada)'][-1])
-
-
-    totais['Freq de Ciclo (r/min)'].append((total_ciclos / total_tempo * 60) if total_tempo > 0 else 0)
-    totais['Comp Médio Ciclo (m/ciclo)'].append(total_distancia / total_ciclos if total_ciclos > 0 else 0)
-    totais['Índice de Ciclo'].append(totais['Vel Média (m/s)'][-1] * totais['Comp Médio Ciclo (m/ciclo)'][-1])
-
-    totais['% Rem Esq'].append((sum(metrics['Rem Esq']) / total_remadas) * 100 if total_remadas > 0 else 0)
-    totais['% Rem Dir'].append((sum(metrics['Rem Dir']) / total_remadas) * 100 if total_remadas > 0 else 0)
-    
-    totais['Fase aérea'].append(fase_aerea_total)
-    totais['Fase aquática'].append(fase_aquatica_total)
-    totais['Fase aérea %'].append(fase_aerea_total_per)
-    totais['Fase aquática %'].append(fase_aquatica_total_per)    
-    
-    return pd.DataFrame(metrics), pd.DataFrame(totais)
+# Limite de entradas de cada cache do Streamlit (as menos usadas são descartadas)
+CACHE_MAX_ENTRIES = 128
 
 
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_events(content):
+    """Lê e normaliza um CSV de remadas; o cache é indexado pelo conteúdo do arquivo."""
+    return read_events(content)
 
-def display_results(df):
-    
-    
-    # Definir a ordem dos trechos
-    trecho_order = [
-        "0-25m", "25-50m", "50-75m", "75-100m",
-        "100-125m", "125-150m", "150-175m", "175-200m"
-    ]
 
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_results(session_key, race_distance, step, _df):
+    return stored_session_results(_df, SegmentGrid(race_distance, step), session_key)
 
-    
-    df_pre = df[df['Teste'] == 'Pre']
-    df_pos = df[df['Teste'] == 'Pos']
 
-    trecho_positions = {0: '0-25m', 25: '25-50m', 50: '50-75m', 75: '75-100m', 100: '100-125m', 125: '125-150m', 150: '150-175m', 175: '175-200m'}
+def cached_session_results(df, grid):
+    """
+    Versão com cache de session_results, indexada pelo hash do conteúdo da sessão e
+    pela configuração da grade: só recalcula sessões cujos dados mudaram. O cache
+    guarda a posição das anomalias, convertida aqui para o índice de `df`.
+    """
+    return label_anomaly_rows(_cached_results(session_hash(df), grid.distance, grid.step, df), df.index)
+
 
-    metrics_pre, totais_pre = calculate_metrics_by_trecho(df_pre, trecho_positions)
-    metrics_pos, totais_pro = calculate_metrics_by_trecho(df_pos, trecho_positions)
+def display_results(results_by_test, grid):
+    
+    
+    # Definir a ordem dos trechos
+    trecho_order = grid.labels
 
     # Exibir os resultados no Streamlit
     st.subheader("Métricas Calculadas")
 
-    # Combinar os resultados de pré e pós para facilitar os gráficos
-    metrics_pre['Tipo de Teste'] = 'Pré-Teste'
-    metrics_pos['Tipo de Teste'] = 'Pós-Teste'
+    all_metrics = []
+    all_totais = []
+    for teste, results in results_by_test.items():
+        metrics, totais = results['metrics'].copy(), results['totais']
 
-    st.subheader("Métricas CalculaSdas no Pré-Teste")
-    st.write(metrics_pre)
+        # Combinar os resultados dos testes para facilitar os gráficos
+        metrics['Tipo de Teste'] = TEST_LABELS.get(teste, teste)
 
-    st.subheader("Métricas Calculadas no Pós-Teste")
-    st.write(metrics_pos)
+        st.subheader(f"Métricas Calculadas no {TEST_LABELS.get(teste, teste)}")
+        if not results['anomalies'].empty:
+            show_anomalies(results['anomalies'])
+        st.write(metrics)
 
-    combined_metrics = pd.concat([metrics_pre, metrics_pos])
+        all_metrics.append(metrics)
+        all_totais.append(totais)
+
+    combined_metrics = pd.concat(all_metrics)
     
-    totais_combinados = pd.concat([totais_pre, totais_pro])
+    totais_combinados = pd.concat(all_totais)
     
     # Exibir as tabelas de métricas para referência
     st.subheader("Geral pré e pós")
@@ -482,42 +151,458 @@ def display_results(df):
     ]
 
 
-    # Criar gráficos para cada variável
-    for variavel in variaveis:
-        st.subheader(f"Gráfico: {variavel}")
+    # Formato longo montado uma única vez: uma linha por (trecho, teste, variável)
+    with stage('display_results.long_frame', len(combined_metrics)):
+        long_metrics = combined_metrics.melt(
+            id_vars=['Trecho', 'Tipo de Teste'],
+            value_vars=variaveis,
+            var_name='Variável',
+            value_name='Valor',
+        )
 
-        # Filtrar os dados para o gráfico
-        fig_data = combined_metrics[['Trecho', 'Tipo de Teste', variavel]].pivot(
-            index='Trecho', columns='Tipo de Teste', values=variavel
+    # Só as variáveis escolhidas viram traços enviados ao navegador
+    st.subheader("Gráficos")
+    selecionadas = st.multiselect("Variáveis", variaveis, default=DEFAULT_CHART_VARIABLES)
+    if selecionadas:
+        with stage('display_results.plotly', len(selecionadas)):
+            st.plotly_chart(comparison_figure(long_metrics, selecionadas, trecho_order))
+    else:
+        st.info("Escolha ao menos uma variável para exibir os gráficos.")
+
+    show_stroke_series(results_by_test)
+
+
+def show_stroke_series(results_by_test):
+    """Série contínua por remada, suavizada por média móvel e reduzida (LTTB) para o gráfico."""
+    st.subheader("Série por remada")
+    columns = st.columns(3)
+    variavel = columns[0].selectbox("Métrica por remada", STROKE_SERIES_METRICS, index=STROKE_SERIES_METRICS.index('Vel (m/s)'))
+    eixo = columns[1].selectbox("Eixo horizontal", ['Distância (m)', 'Tempo (s)'])
+    janela = columns[2].number_input("Média móvel (remadas)", min_value=1, max_value=200, value=STROKE_WINDOW)
+
+    series = []
+    with stage('display_results.stroke_series'):
+        for teste, results in results_by_test.items():
+            strokes = smooth_stroke_series(results['strokes'], int(janela))
+            # Só a coluna do gráfico segue para a redução e o navegador
+            points = downsample(strokes[[eixo, variavel]], eixo, variavel, MAX_POINTS)
+            series.append(points.assign(**{'Tipo de Teste': TEST_LABELS.get(teste, teste)}))
+    if not series or all(points.empty for points in series):
+        st.info("Não há remadas completas para exibir.")
+        return
+
+    with stage('display_results.plotly', len(series)):
+        fig = px.line(
+            pd.concat(series, ignore_index=True),
+            x=eixo,
+            y=variavel,
+            color='Tipo de Teste',
+            render_mode='webgl',
+            title=f'{variavel} por remada (média móvel de {int(janela)})',
+            labels={'Tipo de Teste': 'Teste'},
         )
+        st.plotly_chart(fig)
+
+
+def show_anomalies(anomalies):
+    """Aviso e relatório das anomalias encontradas na validação dos eventos da sessão."""
+    n_errors = anomalies.loc[anomalies['Gravidade'] == ERRO, 'Linha'].nunique()
+    st.warning(
+        f"{len(anomalies)} anomalia(s) no registro; {n_errors} evento(s) com erro "
+        "ficaram fora dos tempos de passagem e das fases."
+    )
+    with st.expander("Relatório de qualidade dos dados"):
+        descriptions = {rule: description for rule, (_, description) in VALIDATION_RULES.items()}
+        st.dataframe(anomalies.assign(Descrição=anomalies['Regra'].map(descriptions)), hide_index=True)
+
+
+def comparison_figure(long_metrics, variaveis, trecho_order):
+    """Uma figura com um painel por variável (eixo y próprio), comparando os testes por trecho."""
+    fig_data = long_metrics[long_metrics['Variável'].isin(variaveis)]
+    fig = px.line(
+        fig_data,
+        x='Trecho',
+        y='Valor',
+        color='Tipo de Teste',
+        facet_row='Variável',
+        category_orders={'Variável': variaveis, 'Trecho': list(trecho_order)},
+        markers=True,
+        height=CHART_ROW_HEIGHT * len(variaveis) + 120,
+        title='Comparação Pré e Pós-Teste',
+        labels={'Tipo de Teste': 'Teste'},
+    )
+    # Cada painel com a sua escala e o nome da variável como título
+    fig.update_yaxes(matches=None, title_text='')
+    fig.for_each_annotation(lambda annotation: annotation.update(text=annotation.text.split('=', 1)[-1]))
+    return fig
+
+
+ 
+def show_export(sessions):
+    """
+    Exportação em lote na barra lateral. `sessions` é uma função que devolve o iterável
+    de ((participante, teste), resultados), só chamada quando o arquivo é gerado.
+    """
+    with st.sidebar.expander("Exportar relatório"):
+        fmt = st.selectbox("Formato", EXPORT_FORMATS, format_func=EXPORT_LABELS.get)
+        if st.button("Gerar arquivo"):
+            with st.spinner("Exportando sessões..."), stage('export'):
+                data, extension = export_bytes(sessions(), fmt)
+            st.download_button(
+                "Baixar",
+                data,
+                file_name=f"paracanue_relatorio.{extension}",
+                mime=EXPORT_MIME_TYPES[extension],
+            )
+
+
+def file_results(file_path, grid):
+    """Resultados de cada teste do participante escolhido, lendo o arquivo completo."""
+    with stage('load_events'), open(file_path, 'rb') as f:
+        df = load_events(f.read())
+    show_export(lambda: (
+        (keys, cached_session_results(session, grid))
+        for keys, session in df.groupby(SESSION_KEYS, observed=True, sort=False)
+    ))
+
+    # Cada arquivo pode conter vários participantes e testes
+    participante = st.sidebar.selectbox("Participante", list(df['Participante'].unique()))
+    athlete = df[df['Participante'] == participante]
+    return {
+        teste: cached_session_results(athlete[athlete['Teste'] == teste], grid)
+        for teste in athlete['Teste'].unique()
+    }
 
-        # Criar o gráfico
+
+def upload_summary(name, events, grid):
+    """Uma linha por sessão do arquivo enviado, com os totais da prova."""
+    rows = []
+    for (participante, teste), session in events.groupby(SESSION_KEYS, observed=True, sort=False):
+        totais = cached_session_results(session, grid)['totais']
+        rows.append({
+            'Arquivo': name,
+            'Participante': participante,
+            'Teste': teste,
+            'Eventos': len(session),
+            'Tempo (s)': totais['Tempo (s)'].iloc[0],
+            'Vel Média (m/s)': totais['Vel Média (m/s)'].iloc[0],
+            'Remadas': totais['Remadas'].iloc[0],
+        })
+    return rows
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_comparison(session_keys, race_distance, step, _table):
+    return bootstrap_paired(_table, n_resamples=BOOTSTRAP_RESAMPLES)
+
+
+def show_squad_comparison(sessions, grid):
+    """
+    Diferença Pós - Pré de cada métrica e trecho entre os atletas com os dois testes,
+    com IC de 95% por bootstrap e tamanho de efeito pareado (d_z).
+    """
+    tables, keys = [], []
+    for participante, entries in sessions.items():
+        for teste, _, session in entries:
+            tables.append(results_long_table((participante, teste), cached_session_results(session, grid)))
+            keys.append(session_hash(session))
+    table = pd.concat(tables, ignore_index=True)
+    comparison = _cached_comparison(tuple(keys), grid.distance, grid.step, table)
+    if comparison.empty or comparison['Atletas'].max() < 2:
+        return
+
+    with st.expander(f"Comparação Pré x Pós do grupo ({comparison['Atletas'].max()} atletas)"):
+        duplicates = duplicate_sessions(table)
+        if not duplicates.empty:
+            pairs = ", ".join(
+                f"{participante} ({TEST_LABELS.get(teste, teste)}: {count})"
+                for participante, teste, count in duplicates.itertuples(index=False)
+            )
+            st.warning(f"Testes com mais de uma sessão entram pela média das sessões: {pairs}.")
+        metric = st.selectbox("Métrica", NUMERIC_METRICS, index=NUMERIC_METRICS.index('Vel Média (m/s)'), key='squad_metric')
+        rows = comparison[comparison['Métrica'] == metric]
+        fig = px.scatter(
+            rows,
+            x='Trecho',
+            y='Diferença',
+            error_y=rows['IC sup'] - rows['Diferença'],
+            error_y_minus=rows['Diferença'] - rows['IC inf'],
+            title=f'{metric}: Pós - Pré (média e IC de 95%)',
+        )
+        fig.add_hline(y=0, line_dash='dot')
+        st.plotly_chart(fig)
+        st.dataframe(rows.drop(columns='Métrica'), hide_index=True)
+
+
+def upload_results(grid):
+    """
+    Resultados do participante escolhido entre os CSVs enviados. Os arquivos novos são
+    lidos em paralelo e cada sessão entra na lista assim que o seu arquivo termina.
+    """
+    files = st.sidebar.file_uploader("Arquivos de sessões (CSV)", type="csv", accept_multiple_files=True)
+    if not files:
+        st.info("Envie um ou mais arquivos CSV de sessões (formato do lb.csv) pela barra lateral.")
+        return None
+
+    # Tabelas já lidas nesta sessão do navegador, por arquivo enviado
+    parsed = st.session_state.setdefault('uploaded_events', {})
+    current = {file.file_id: file for file in files}
+    for file_id in [file_id for file_id in parsed if file_id not in current]:
+        del parsed[file_id]
+
+    pending = [file for file in files if file.file_id not in parsed]
+    if pending:
+        progress = st.progress(0.0, text=f"Lendo {len(pending)} arquivo(s)...")
+        listing = st.empty()
+        rows = []
+        with stage('upload.parse', len(pending)):
+            sources = ((file.file_id, file.getvalue()) for file in pending)
+            for done, (file_id, events, error) in enumerate(iter_csv_files(sources), start=1):
+                name = current[file_id].name
+                parsed[file_id] = (name, events, error)
+                if events is not None:
+                    rows += upload_summary(name, events, grid)
+                    listing.dataframe(pd.DataFrame(rows), hide_index=True)
+                progress.progress(done / len(pending), text=f"{done} de {len(pending)} arquivo(s) lidos")
+        progress.empty()
+        listing.empty()
+
+    sessions = {}
+    rows = []
+    for name, events, error in parsed.values():
+        if error is not None:
+            detail = f"coluna {error} ausente" if isinstance(error, KeyError) else error
+            st.error(f"{name}: não foi possível ler o arquivo ({detail}).")
+            continue
+        rows += upload_summary(name, events, grid)
+        for (participante, teste), session in events.groupby(SESSION_KEYS, observed=True, sort=False):
+            sessions.setdefault(participante, []).append((teste, name, session))
+    if not sessions:
+        return {}
+    with st.expander(f"Sessões enviadas ({len(rows)})"):
+        st.dataframe(pd.DataFrame(rows), hide_index=True)
+    show_squad_comparison(sessions, grid)
+
+    def all_sessions():
+        for nome, entries in sessions.items():
+            testes = [teste for teste, _, _ in entries]
+            for teste, name, session in entries:
+                label = teste if testes.count(teste) == 1 else f"{teste} ({name})"
+                yield (nome, label), cached_session_results(session, grid)
+
+    show_export(all_sessions)
+
+    # O mesmo teste em arquivos diferentes é identificado pelo nome do arquivo
+    participante = st.sidebar.selectbox("Participante", sorted(sessions))
+    entries = sessions[participante]
+    order = {teste: i for i, teste in enumerate(ordered_tests({teste for teste, _, _ in entries}))}
+    entries.sort(key=lambda entry: (order[entry[0]], entry[1]))
+    labels = [teste for teste, _, _ in entries]
+    return {
+        (teste if labels.count(teste) == 1 else f"{TEST_LABELS.get(teste, teste)} ({name})"):
+            cached_session_results(session, grid)
+        for teste, name, session in entries
+    }
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_athlete(root, participante, signature):
+    """Lê só as partições de um participante; `signature` muda quando os arquivos mudam."""
+    return load_sessions(root, participants=[participante])
+
+
+def store_results(root, sessions, grid):
+    """Resultados de cada teste do participante escolhido, lidos do arquivo de sessões."""
+    def all_sessions():
+        for nome in dict.fromkeys(nome for nome, _ in sessions):
+            events = load_athlete(root, nome, partition_signature(root, nome))
+            for teste in ordered_tests(events['Teste'].unique()):
+                session = events[events['Teste'] == teste].reset_index(drop=True)
+                yield (nome, teste), cached_session_results(session, grid)
+
+    show_export(all_sessions)
+    participante = st.sidebar.selectbox("Participante", list(dict.fromkeys(nome for nome, _ in sessions)))
+    athlete = load_athlete(root, participante, partition_signature(root, participante))
+    return {
+        teste: cached_session_results(athlete[athlete['Teste'] == teste].reset_index(drop=True), grid)
+        for teste in ordered_tests(athlete['Teste'].unique())
+    }
+
+
+def ordered_tests(testes):
+    """Pré e Pós primeiro (arquivo e banco não guardam a ordem original dos testes)."""
+    order = {teste: i for i, teste in enumerate(TEST_LABELS)}
+    return sorted(testes, key=lambda teste: (order.get(teste, len(order)), teste))
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_db_events(path, session_id, content_hash):
+    """Eventos de uma sessão do banco; `content_hash` muda quando a sessão é substituída."""
+    return SessionDatabase(path).load_events(session_id)
+
+
+def db_results(db, grid):
+    """Resultados de cada teste do participante e da data escolhidos, lidos do banco de sessões."""
+    sessions = db.sessions()
+    # No banco o mesmo teste se repete em várias datas: a data entra no rótulo do teste
+    show_export(lambda: (
+        ((row.participante, f"{row.teste} ({row.test_date})"),
+         cached_session_results(load_db_events(db.path, int(row.id), row.content_hash), grid))
+        for row in sessions.itertuples(index=False)
+    ))
+    participante = st.sidebar.selectbox("Participante", list(dict.fromkeys(sessions['participante'])))
+    athlete = sessions[sessions['participante'] == participante]
+    test_date = st.sidebar.selectbox("Data do teste", sorted(athlete['test_date'].unique(), reverse=True))
+    chosen = athlete[athlete['test_date'] == test_date].set_index('teste')
+    return {
+        teste: cached_session_results(
+            load_db_events(db.path, int(chosen.loc[teste, 'id']), chosen.loc[teste, 'content_hash']), grid
+        )
+        for teste in ordered_tests(chosen.index)
+    }
+
+
+def show_cohort(db, grid):
+    """Consulta de uma métrica por trecho entre atletas e datas de teste."""
+    with st.expander("Consulta de coorte"):
+        columns = st.columns(4)
+        metric = columns[0].selectbox("Métrica", NUMERIC_METRICS, index=NUMERIC_METRICS.index('Vel Média (m/s)'))
+        trecho = columns[1].selectbox("Trecho", grid.labels + [grid.total_label])
+        categoria = columns[2].selectbox("Categoria", ["Todas"] + db.categories())
+        last_dates = columns[3].number_input("Últimas datas", min_value=1, max_value=1000, value=6)
+
+        with st.spinner("Calculando métricas das sessões sem esta grade..."):
+            db.ensure_metrics(grid)
+        summary = db.cohort_summary(
+            metric,
+            trecho,
+            grid,
+            categoria=None if categoria == "Todas" else categoria,
+            last_dates=int(last_dates),
+        )
+        if summary.empty:
+            st.info("Nenhuma sessão encontrada para a consulta.")
+            return
+        st.dataframe(summary, hide_index=True)
         fig = px.line(
-            fig_data,
-            x=fig_data.index,
-            y=fig_data.columns,
+            summary.assign(teste=summary['teste'].map(lambda teste: TEST_LABELS.get(teste, teste))),
+            x='test_date',
+            y='mean',
+            error_y='std',
+            color='teste',
             markers=True,
-            title=f'{variavel} - Comparação Pré e Pós-Teste',
-            labels={'value': variavel, 'x': 'Trecho', 'variable': 'Teste'}
+            title=f'{metric} no trecho {trecho} (média da coorte)',
+            labels={'test_date': 'Data do teste', 'mean': metric, 'teste': 'Teste'},
         )
-
-        # Adicionar o gráfico no Streamlit
         st.plotly_chart(fig)
 
 
- 
+def live_results(file_path, grid):
+    """
+    Resultados de uma sessão ao vivo: a cada execução só as linhas novas do arquivo são
+    lidas e incorporadas aos acumuladores guardados na sessão do Streamlit.
+    """
+    key = ('live', file_path, grid)
+    if key not in st.session_state:
+        st.session_state[key] = (CsvTail(file_path), StreamingIngestor(grid))
+    tail, ingestor = st.session_state[key]
+
+    # Ao encerrar, a última linha é lida mesmo sem quebra de linha no fim do arquivo
+    final = st.sidebar.checkbox("Sessão encerrada")
+    new_events = tail.poll(final=final)
+    if new_events is not None:
+        ingestor.update(new_events)
+    if st.sidebar.button("Atualizar"):
+        st.rerun()
+
+    show_export(lambda: ((keys, session.results()) for keys, session in list(ingestor.sessions.items())))
+    participantes = list(dict.fromkeys(participante for participante, _ in ingestor.sessions))
+    participante = st.sidebar.selectbox("Participante", participantes)
+    return {
+        teste: session.results()
+        for (nome, teste), session in ingestor.sessions.items()
+        if nome == participante
+    }
+
+
+def show_profile(profiler):
+    """Painel lateral com o custo de cada etapa da última execução e exportação em JSON."""
+    with st.sidebar.expander("Desempenho", expanded=True):
+        summary = pd.DataFrame(profiler.summary())
+        if summary.empty:
+            st.write("Nenhuma etapa medida.")
+            return
+        summary['total (ms)'] = summary['total_s'] * 1000
+        summary['média (ms)'] = summary['mean_s'] * 1000
+        summary['pico (MiB)'] = summary['peak_bytes'].astype(float) / 2**20
+        st.dataframe(
+            summary[['stage', 'calls', 'rows', 'total (ms)', 'média (ms)', 'pico (MiB)']],
+            hide_index=True,
+        )
+        st.download_button(
+            "Exportar medições (JSON)",
+            profiler.to_json(),
+            file_name="paracanue_profile.json",
+            mime="application/json",
+        )
+        if profiler.stats_text:
+            st.text(profiler.stats_text)
+
+
+def render_dashboard(file_path, grid):
+    # Fonte dos dados: CSV (completo ou ao vivo), arquivo de sessões em Parquet ou
+    # banco de sessões (SQLite)
+    stored_sessions = list_sessions(DEFAULT_STORE)
+    sources = ["Enviar arquivos", "Arquivo CSV"]
+    if stored_sessions:
+        sources.append("Arquivo de sessões")
+    if os.path.exists(DEFAULT_DB_PATH):
+        sources.append("Banco de sessões")
+    source = st.sidebar.radio("Fonte dos dados", sources)
+
+    if source == "Enviar arquivos":
+        results_by_test = upload_results(grid)
+        if results_by_test is None:
+            return
+    elif source == "Banco de sessões":
+        db = SessionDatabase(DEFAULT_DB_PATH)
+        show_cohort(db, grid)
+        results_by_test = db_results(db, grid)
+    elif source == "Arquivo de sessões":
+        results_by_test = store_results(DEFAULT_STORE, stored_sessions, grid)
+    elif st.sidebar.checkbox("Sessão ao vivo (leitura incremental)"):
+        results_by_test = live_results(file_path, grid)
+    else:
+        results_by_test = file_results(file_path, grid)
+
+    if not results_by_test:
+        st.info("Ainda não há eventos registrados.")
+        return
+
+    display_results(results_by_test, grid)
+
+
 def main():
     st.title("Análise de Remadas em Caiaque")
     file_path = "lb.csv"
 
-    df = pd.read_csv(file_path)
+    # Configuração da grade de trechos
+    race_distance = st.sidebar.selectbox("Distância da prova (m)", RACE_DISTANCES)
+    step = st.sidebar.selectbox("Tamanho do trecho (m)", SEGMENT_STEPS, index=SEGMENT_STEPS.index(25))
+    grid = SegmentGrid(race_distance, step)
 
-    if df['Distância'].dtype == 'object':
-        df['Distância'] = df['Distância'].str.replace(',', '.')
+    # Medição das etapas (padrão definido por PARACANUE_PROFILE)
+    profiler = None
+    if st.sidebar.checkbox("Medir desempenho", value=PROFILE_ENABLED):
+        profiler = StageProfiler(cprofile=PROFILE_FLAG == 'cprofile')
+        profiler.meta = {'distance': grid.distance, 'step': grid.step}
 
-    df['Distância'] = pd.to_numeric(df['Distância'], errors='coerce')
+    with activate(profiler):
+        with stage('render_dashboard'):
+            render_dashboard(file_path, grid)
 
-    display_results(df)
+    if profiler is not None:
+        show_profile(profiler)
 
 
 if __name__ == "__main__":
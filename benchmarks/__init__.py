@@ -0,0 +1 @@
+"""Gerador de provas sintéticas, implementação de referência e benchmarks das métricas."""
@@ -0,0 +1,234 @@
+"""
+Conferência de comportamento dos módulos em volta do cálculo: arquivo de sessões,
+bootstrap do grupo, descarte do cache em disco e linha de comando.
+
+Cada conferência roda em um diretório temporário e devolve o número de divergências,
+descritas na saída de erro como as de benchmarks/run.py.
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import stroke_metrics as sm
+from benchmarks.synthetic import corrupt_race, generate_race
+from metrics_cache import MetricsCache
+from squad_stats import bootstrap_paired, resample_weights
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _report(name, problems):
+    if not problems:
+        return 0
+    print(f'DIVERGÊNCIA {name}:', file=sys.stderr)
+    for problem in problems:
+        print(f'  {problem}', file=sys.stderr)
+    return 1
+
+
+def check_store_roundtrip():
+    """Sessões com nomes com espaço, acento e '/' voltam iguais do arquivo de sessões."""
+    from session_store import import_csv, list_sessions, load_sessions, partition_signature, require_pyarrow
+
+    try:
+        require_pyarrow()
+    except ImportError as exc:
+        print(f'{exc} Arquivo de sessões não conferido.', file=sys.stderr)
+        return 0
+
+    names = ['Ana Maria/Ç', 'José']
+    raw = pd.concat(
+        [generate_race(participant=name, test=test, seed=i) for i, (name, test) in
+         enumerate((name, test) for name in names for test in ('Pré', 'Pós'))],
+        ignore_index=True,
+    )
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sessoes.csv')
+        root = os.path.join(directory, 'sessions')
+        raw.to_csv(path, index=False)
+        import_csv(path, root)
+
+        expected = sorted(raw[sm.SESSION_KEYS].drop_duplicates().itertuples(index=False, name=None))
+        if sorted(list_sessions(root)) != expected:
+            problems.append(f'list_sessions={sorted(list_sessions(root))!r} esperado={expected!r}')
+        events = sm.load_csv(path)
+        for name in names:
+            if not partition_signature(root, name):
+                problems.append(f'partition_signature vazia para {name!r}')
+            stored = load_sessions(root, participants=[name])
+            for teste in ('Pré', 'Pós'):
+                original = events[(events['Participante'] == name) & (events['Teste'] == teste)]
+                loaded = stored[stored['Teste'] == teste]
+                columns = ['t_seconds', 'distance', 'action', 'side']
+                if not original[columns].reset_index(drop=True).equals(loaded[columns].reset_index(drop=True)):
+                    problems.append(f'eventos de {name!r} {teste} diferentes após a leitura')
+    return _report('arquivo de sessões', problems)
+
+
+def _naive_bootstrap(table, metrics, pre, pos, n_resamples, confidence, seed):
+    # Uma reamostragem e uma célula por vez, repetindo cada atleta pelo seu peso
+    athletes = sorted(
+        set(table.loc[table['Teste'] == pre, 'Participante']) & set(table.loc[table['Teste'] == pos, 'Participante'])
+    )
+    cells = table.set_index(['Teste', 'Participante', 'Trecho'])
+    weights = resample_weights(np.random.default_rng(seed), len(athletes), n_resamples).astype(int)
+    alpha = (1 - confidence) / 2
+    rows = []
+    for metric in metrics:
+        for trecho in pd.unique(table['Trecho']):
+            differences = np.array([
+                cells[metric].get((pos, athlete, trecho), np.nan) - cells[metric].get((pre, athlete, trecho), np.nan)
+                for athlete in athletes
+            ])
+            present = ~np.isnan(differences)
+            if not present.any():
+                continue
+            means, effects = [], []
+            for w in weights:
+                sample = np.repeat(differences, w)
+                sample = sample[~np.isnan(sample)]
+                mean = sample.mean() if len(sample) else np.nan
+                sd = sample.std(ddof=1) if len(sample) > 1 else np.nan
+                means.append(mean)
+                effects.append(mean / sd if sd > 0 else np.nan)
+            sd = differences[present].std(ddof=1) if present.sum() > 1 else np.nan
+            rows.append({
+                'Trecho': trecho,
+                'Métrica': metric,
+                'Atletas': int(present.sum()),
+                'Diferença': differences[present].mean(),
+                'IC inf': np.nanquantile(means, alpha),
+                'IC sup': np.nanquantile(means, 1 - alpha),
+                'd_z': differences[present].mean() / sd if sd > 0 else np.nan,
+                'd_z IC inf': np.nanquantile(effects, alpha),
+                'd_z IC sup': np.nanquantile(effects, 1 - alpha),
+            })
+    return pd.DataFrame(rows)
+
+
+def check_bootstrap(seed=3, n_resamples=300):
+    """bootstrap_paired coincide com um laço por reamostragem em um grupo pequeno."""
+    grid = sm.SegmentGrid(200, 50)
+    raws = []
+    for i in range(5):
+        raws.append(generate_race(participant=f'P{i}', test='Pre', seed=2 * i))
+        # Um atleta com o Pós incompleto (trechos finais ausentes) e outro sem o Pós
+        if i == 3:
+            raws.append(generate_race(participant=f'P{i}', test='Pos', seed=2 * i + 1, max_events=80))
+        elif i != 4:
+            raws.append(generate_race(participant=f'P{i}', test='Pos', seed=2 * i + 1))
+    events = sm.normalize_events(pd.concat(raws, ignore_index=True))
+    table = sm.calculate_metrics_batch(events, grid, max_workers=1)
+    metrics = ['Vel Média (m/s)', 'Remadas', 'Fase aérea %']
+
+    result = bootstrap_paired(table, metrics=metrics, n_resamples=n_resamples, seed=seed)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        expected = _naive_bootstrap(table, metrics, 'Pre', 'Pos', n_resamples, 0.95, seed)
+    problems = []
+    try:
+        pd.testing.assert_frame_equal(
+            expected.reset_index(drop=True),
+            result[expected.columns].reset_index(drop=True),
+            check_dtype=False,
+            rtol=1e-9,
+        )
+    except AssertionError as exc:
+        problems.append(str(exc).splitlines()[0])
+    return _report('bootstrap do grupo', problems)
+
+
+def check_cache_eviction():
+    """Ao passar do limite, o cache descarta as entradas acessadas há mais tempo, e só elas."""
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite')
+        value = b'x' * 1000
+        cache = MetricsCache(path, max_bytes=3500)
+        for key in 'abc':
+            cache.put(key, value)
+        # Acessos antigos: 'a' é o mais antigo, mas é lido antes da próxima gravação
+        now = time.time()
+        with closing(sqlite3.connect(path)) as conn, conn:
+            conn.executemany(
+                'UPDATE entries SET last_access = ? WHERE key = ?',
+                [(now - 300, 'a'), (now - 200, 'b'), (now - 100, 'c')],
+            )
+        if cache.get('a') != value:
+            problems.append("entrada 'a' não encontrada")
+        cache.put('d', value)
+        with closing(sqlite3.connect(path)) as conn:
+            keys = sorted(key for key, in conn.execute('SELECT key FROM entries'))
+            total = conn.execute("SELECT value FROM stats WHERE name = 'total_bytes'").fetchone()[0]
+            size = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if keys != ['a', 'c', 'd']:
+            problems.append(f"entradas após o descarte {keys!r}, esperado ['a', 'c', 'd']")
+        if total != size:
+            problems.append(f'total_bytes={total} e soma dos tamanhos={size}')
+    return _report('descarte do cache', problems)
+
+
+def _cli(*args):
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'cli.py'), '--no-cache', *args],
+        capture_output=True, text=True, cwd=ROOT,
+    )
+    return result.returncode, result.stderr
+
+
+def check_cli_shared_sessions():
+    """
+    `cli.py metrics` e `validate` com dois arquivos da mesma sessão (participante,
+    teste) calculam cada arquivo separadamente, sem misturar os registros.
+    """
+    grid = sm.SegmentGrid(200, 25)
+    problems = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, f'{name}.csv') for name in ('a', 'b')]
+        for path in paths:
+            corrupt_race(generate_race(200, seed=1), seed=1).to_csv(path, index=False)
+        events = sm.load_csv(paths[0])
+
+        metrics_path = os.path.join(directory, 'metricas.csv')
+        code, stderr = _cli('metrics', *paths, '--workers', '1', '-o', metrics_path)
+        if code != 0:
+            problems.append(f'metrics terminou com código {code}: {stderr.strip()}')
+        else:
+            single = sm.calculate_metrics_batch(events, grid, max_workers=1)
+            expected = pd.concat([single, single], ignore_index=True)
+            expected[sm.SESSION_KEYS] = expected[sm.SESSION_KEYS].astype(str)
+            try:
+                pd.testing.assert_frame_equal(expected, pd.read_csv(metrics_path), check_dtype=False, rtol=1e-9)
+            except AssertionError as exc:
+                problems.append(f'metrics: {str(exc).splitlines()[0]}')
+            if '2 arquivos' not in stderr:
+                problems.append('metrics não avisou a sessão repetida')
+
+        report_path = os.path.join(directory, 'anomalias.csv')
+        code, stderr = _cli('validate', *paths, '-o', report_path)
+        if code != 0:
+            problems.append(f'validate terminou com código {code}: {stderr.strip()}')
+        else:
+            _, report = sm.validate_events(events)
+            if len(pd.read_csv(report_path)) != 2 * len(report):
+                problems.append(f'validate: {len(pd.read_csv(report_path))} anomalias, esperado {2 * len(report)}')
+    return _report('linha de comando com sessão repetida', problems)
+
+
+def run_behavior_checks():
+    """Todas as conferências deste módulo; retorna o número de divergências."""
+    return (
+        check_store_roundtrip() +
+        check_bootstrap() +
+        check_cache_eviction() +
+        check_cli_shared_sessions()
+    )
@@ -0,0 +1,168 @@
+"""
+Implementação de referência, evento a evento, das métricas de stroke_metrics.
+
+Segue os laços originais do app (iloc linha a linha sobre o registro bruto),
+generalizados para qualquer SegmentGrid. É lenta de propósito: serve de oráculo para
+conferir as versões vetorizadas em registros pequenos.
+"""
+import numpy as np
+
+
+def _time(row):
+    return row['Min'] * 60 + row['Segundo'] + row['Milesimos'] / 1000
+
+
+def reference_split_times(df, positions, finish):
+    # Sem marcação exata da chegada, vale o tempo interpolado nela (None se não
+    # alcançada) em vez do 0 do app original, que gerava tempo negativo no último trecho
+    estimated_times = {pos: None for pos in list(positions) + [finish]}
+    estimated_finish = None
+    for i in range(1, len(df)):
+        current_pos = df.iloc[i]['Distância']
+        previous_pos = df.iloc[i - 1]['Distância']
+        if current_pos == finish:
+            estimated_finish = _time(df.iloc[i - 1])
+        if previous_pos < current_pos:
+            for pos in estimated_times:
+                if previous_pos <= pos <= current_pos and estimated_times[pos] is None:
+                    time_prev = _time(df.iloc[i - 1])
+                    time_current = _time(df.iloc[i])
+                    estimated_times[pos] = (
+                        time_prev +
+                        (pos - previous_pos) * (time_current - time_prev) / (current_pos - previous_pos)
+                    )
+    if estimated_finish is not None and not np.isnan(estimated_finish):
+        estimated_times[finish] = estimated_finish
+    return estimated_times
+
+
+def reference_phases(df, grid):
+    """Tempos das fases aérea e aquática por trecho: dicionários indexados pelo início do trecho."""
+    edges = list(grid.edges)
+    air = {start: 0.0 for start in grid.starts}
+    water = {start: 0.0 for start in grid.starts}
+
+    for i in range(1, len(df)):
+        current_action = df.iloc[i - 1]['Ação']
+        next_action = df.iloc[i]['Ação']
+        if current_action == 'Saida' and next_action == 'Entrada':
+            target = air
+        elif current_action == 'Entrada' and next_action == 'Saida':
+            target = water
+        else:
+            continue
+
+        start_time, end_time = _time(df.iloc[i - 1]), _time(df.iloc[i])
+        start_dist, end_dist = df.iloc[i - 1]['Distância'], df.iloc[i]['Distância']
+
+        started = False
+        for j in range(len(edges) - 1):
+            overlap_start = max(start_dist, edges[j])
+            overlap_end = min(end_dist, edges[j + 1])
+            if start_dist < edges[j + 1] and end_dist > edges[j] and overlap_start < overlap_end:
+                target[edges[j]] += (overlap_end - overlap_start) * (end_time - start_time) / (end_dist - start_dist)
+                started = True
+
+        # Sem transição: o tempo todo vai para o trecho que contém o início do intervalo;
+        # intervalos que avançam sem sobrepor a grade estão fora da prova e são descartados
+        if not started and end_dist <= start_dist and edges[0] <= start_dist <= edges[-1]:
+            current = edges[0]
+            for start in grid.starts:
+                if start <= start_dist:
+                    current = start
+            target[current] += end_time - start_time
+    return air, water
+
+
+def reference_cycles(df, grid):
+    edges = list(grid.edges)
+    trecho_ciclos = {label: 0 for label in grid.labels}
+    cycles = 0
+    lost_strokes = 0
+
+    i = 0
+    while i < len(df) - 1:
+        if df.iloc[i]['Ação'] == 'Entrada' and df.iloc[i + 1]['Ação'] == 'Saida':
+            current_side = df.iloc[i]['Pá do remo']
+            if i + 3 < len(df) and df.iloc[i + 2]['Ação'] == 'Entrada' and df.iloc[i + 3]['Ação'] == 'Saida':
+                if df.iloc[i + 2]['Pá do remo'] != current_side:
+                    cycles += 1
+                    start_dist = df.iloc[i]['Distância']
+                    end_dist = df.iloc[i + 3]['Distância']
+
+                    max_overlap = 0
+                    assigned = None
+                    for j in range(len(edges) - 1):
+                        if start_dist < edges[j + 1] and end_dist > edges[j]:
+                            overlap = min(end_dist, edges[j + 1]) - max(start_dist, edges[j])
+                            if overlap > max_overlap:
+                                max_overlap = overlap
+                                assigned = grid.labels[j]
+                    if assigned:
+                        trecho_ciclos[assigned] += 1
+                    i += 4
+                    continue
+        lost_strokes += 1
+        i += 2
+    return cycles, lost_strokes, trecho_ciclos
+
+
+def reference_stroke_counts(df, grid):
+    """Remadas por trecho com o filtro inclusivo [início, fim] de cada trecho."""
+    counts = {}
+    for start, end, label in zip(grid.starts, grid.ends, grid.labels):
+        trecho = df[(df['Distância'] >= start) & (df['Distância'] <= end)]
+        remadas = trecho[trecho['Ação'] == 'Saida']
+        counts[label] = (
+            len(trecho),
+            len(remadas),
+            int((remadas['Pá do remo'] == 'Esquerda').sum()),
+            int((remadas['Pá do remo'] == 'Direita').sum()),
+        )
+    return counts
+
+
+def compare(raw, grid, rtol=1e-6):
+    """
+    Confere as funções vetorizadas contra a referência em um registro bruto de uma sessão.
+
+    Returns:
+        list: Descrição das divergências encontradas (vazia se tudo confere).
+    """
+    import stroke_metrics as sm
+
+    raw = raw.reset_index(drop=True)
+    events = sm.normalize_events(raw)
+    # A referência usa a mesma precisão de distância da tabela normalizada
+    raw = raw.assign(**{'Distância': events['distance'].to_numpy(dtype=float)})
+    problems = []
+
+    def check(name, expected, actual):
+        expected = np.nan if expected is None else expected
+        actual = np.nan if actual is None else actual
+        if not np.isclose(expected, actual, rtol=rtol, atol=1e-6, equal_nan=True):
+            problems.append(f'{name}: referência={expected!r} vetorizado={actual!r}')
+
+    expected = reference_split_times(raw, grid.starts, grid.finish)
+    actual = sm.estimate_time_at_positions(events, grid.starts, grid.finish)
+    for pos in expected:
+        check(f'tempo em {pos} m', expected[pos], actual[pos])
+
+    air, water = reference_phases(raw, grid)
+    phases = sm.calculate_phases_with_total_times_and_percentages(events, grid, None)
+    for start in grid.starts:
+        check(f'fase aérea {start}', air[start], phases[0][start])
+        check(f'fase aquática {start}', water[start], phases[1][start])
+
+    cycles, lost, trecho_ciclos = reference_cycles(raw, grid)
+    actual_cycles, actual_lost, actual_trecho = sm.calculate_cycles_and_lost_strokes(events, grid)
+    check('ciclos', cycles, actual_cycles)
+    check('remadas perdidas', lost, actual_lost)
+    for label in grid.labels:
+        check(f'ciclos {label}', trecho_ciclos[label], actual_trecho[label])
+
+    counts = sm.count_strokes_by_trecho(events, grid)
+    for label, values in reference_stroke_counts(raw, grid).items():
+        for column, value in zip(['Eventos', 'Remadas', 'Rem Esq', 'Rem Dir'], values):
+            check(f'{column} {label}', value, counts.loc[label, column])
+    return problems
@@ -0,0 +1,235 @@
+"""
+Benchmark das etapas de cálculo em registros sintéticos de 10^3 a 10^6 eventos.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.run
+    python -m benchmarks.run --sizes 1000 10000 --repeat 5 --json bench.json
+    python -m benchmarks.run --check-only
+
+Para cada tamanho, mede o tempo de cada etapa (melhor de `--repeat` execuções) e
+estima o expoente de escala (inclinação log-log do tempo pelo número de eventos).
+Registros até `--check-max` eventos também são conferidos contra a implementação de
+referência (benchmarks/reference.py), inclusive com uma grade mais curta que a prova,
+e registros com falhas injetadas são processados em blocos aleatórios pelo streaming e
+comparados com o cálculo da sessão completa. A conferência inclui ainda o comportamento
+do arquivo de sessões, do bootstrap do grupo, do cache em disco e da linha de comando
+(benchmarks/behavior.py).
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+import pandas as pd
+
+import stroke_metrics as sm
+from benchmarks.behavior import run_behavior_checks
+from benchmarks.reference import compare
+from benchmarks.synthetic import corrupt_race, generate_race
+from streaming import SessionAccumulator
+
+# Eventos por metro em uma prova gerada com os parâmetros padrão (estimativa por baixo,
+# para que o registro seja cortado em exatamente `n_events`)
+EVENTS_PER_METER = 0.6
+
+# Quantidade fixa de trechos, para que o custo medido seja o do número de eventos
+N_SEGMENTS = 200
+
+STAGES = {
+    'normalize_events': lambda raw, events, grid: sm.normalize_events(raw),
+    'estimate_time_at_positions': lambda raw, events, grid: sm.estimate_time_at_positions(events, grid.starts, grid.finish),
+    'calculate_phases': lambda raw, events, grid: sm.calculate_phases_with_total_times_and_percentages(events, grid, None),
+    'calculate_cycles_and_lost_strokes': lambda raw, events, grid: sm.calculate_cycles_and_lost_strokes(events, grid),
+    'calculate_metrics_by_trecho': lambda raw, events, grid: sm.calculate_metrics_by_trecho(events, grid),
+    'stroke_series': lambda raw, events, grid: sm.stroke_series(events),
+}
+
+
+def make_case(n_events, seed=0):
+    """Prova sintética com aproximadamente `n_events` eventos e sua grade de trechos."""
+    distance = max(25, round(n_events / EVENTS_PER_METER))
+    raw = generate_race(distance=distance, max_events=n_events, seed=seed)
+    grid = sm.SegmentGrid(distance, distance / N_SEGMENTS)
+    return raw, sm.normalize_events(raw), grid
+
+
+def time_stage(stage, raw, events, grid, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage(raw, events, grid)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def scaling_exponent(sizes, seconds):
+    """Inclinação da reta log(tempo) x log(eventos): ~1 indica custo linear."""
+    if len(sizes) < 2:
+        return float('nan')
+    return float(np.polyfit(np.log(sizes), np.log(np.maximum(seconds, 1e-9)), 1)[0])
+
+
+def run_checks(check_max, seeds):
+    failures = 0
+    for n_events in (200, 1000, check_max):
+        for seed in range(seeds):
+            raw, _, grid = make_case(n_events, seed=seed)
+            # A última grade cobre só metade da prova (registro mais longo que a grade)
+            race_grids = (
+                grid,
+                sm.SegmentGrid(grid.distance, grid.distance / 8),
+                sm.SegmentGrid(grid.distance / 2, grid.distance / 16),
+            )
+            for race_grid in race_grids:
+                problems = compare(raw, race_grid)
+                if problems:
+                    failures += 1
+                    print(f'DIVERGÊNCIA n={n_events} seed={seed} passo={race_grid.step:g}:', file=sys.stderr)
+                    for problem in problems[:10]:
+                        print(f'  {problem}', file=sys.stderr)
+    return failures
+
+
+def check_short_grid(seeds):
+    """
+    Em uma prova mais longa que a grade, as fases somadas não podem passar do tempo até
+    a chegada da grade: os intervalos depois dela ficam fora de todos os trechos.
+    """
+    failures = 0
+    grid = sm.SegmentGrid(200, 25)
+    for seed in range(seeds):
+        events = sm.normalize_events(generate_race(500, seed=seed))
+        _, totais = sm.calculate_metrics_by_trecho(events, grid)
+        splits = sm.estimate_time_at_positions(events, grid.starts, grid.finish)
+        elapsed = splits[grid.finish] - events['t_seconds'].iloc[0]
+        phases = totais['Fase aérea'].iloc[0] + totais['Fase aquática'].iloc[0]
+        if phases > elapsed + 1e-6:
+            failures += 1
+            print(f'DIVERGÊNCIA grade menor que a prova seed={seed}: fases {phases:.2f} s em {elapsed:.2f} s', file=sys.stderr)
+    return failures
+
+
+def check_time_blocks(seeds, shift=20.0, block=3):
+    """
+    Um bloco de `block` eventos deslocado `shift` s para trás deve ser marcado inteiro
+    como tempo_recuando, sem somar fase falsa aos trechos (sem os tempos do bloco, as
+    fases só podem diminuir em relação ao registro original).
+    """
+    failures = 0
+    for seed in range(seeds):
+        raw, events, grid = make_case(1000, seed=seed)
+        grid = sm.SegmentGrid(grid.distance, grid.distance / 8)
+        original, _ = sm.calculate_metrics_by_trecho(events, grid)
+        start = len(events) // 3
+        rows = events.index[start:start + block]
+        events.loc[rows, 't_seconds'] -= shift
+        clean, report = sm.validate_events(events)
+        flagged = set(report.loc[report['Regra'] == 'tempo_recuando', 'Linha'])
+        metrics, _ = sm.calculate_metrics_by_trecho(sm.apply_clean_mask(events, clean), grid)
+        phases = ['Fase aérea', 'Fase aquática']
+        problems = []
+        if not set(rows) <= flagged:
+            problems.append(f'linhas {sorted(set(rows) - flagged)} recuadas e não marcadas')
+        if (metrics[phases] > original[phases] + 1e-6).any(axis=None):
+            problems.append('fases maiores que as do registro original')
+        if problems:
+            failures += 1
+            print(f'DIVERGÊNCIA bloco recuado seed={seed}: {"; ".join(problems)}', file=sys.stderr)
+    return failures
+
+
+def compare_results(expected, actual):
+    """Divergências entre dois resultados no formato de compute_session_results."""
+    problems = []
+    for name in ('metrics', 'totais', 'strokes', 'anomalies'):
+        try:
+            pd.testing.assert_frame_equal(
+                expected[name].reset_index(drop=True),
+                actual[name].reset_index(drop=True),
+                check_dtype=False,
+                check_categorical=False,
+            )
+        except AssertionError as exc:
+            problems.append(f'{name}: {str(exc).splitlines()[0]}')
+    positions = list(expected['splits'])
+    splits = [
+        np.array([np.nan if result['splits'].get(pos) is None else result['splits'][pos] for pos in positions])
+        for result in (expected, actual)
+    ]
+    if list(actual['splits']) != positions or not np.allclose(*splits, equal_nan=True):
+        problems.append('splits: tempos de passagem diferentes')
+    return problems
+
+
+def check_streaming(seeds, trials=10):
+    """
+    O streaming (SessionAccumulator) com blocos de tamanho aleatório, e resultados
+    pedidos no meio do registro, deve coincidir com compute_session_results.
+    """
+    failures = 0
+    rng = np.random.default_rng(0)
+    for seed in range(seeds):
+        raw = corrupt_race(generate_race(200, seed=seed), n_faults=15, seed=seed)
+        events = sm.normalize_events(raw)
+        for grid in (sm.SegmentGrid(200, 25), sm.SegmentGrid(500, 50)):
+            expected = sm.compute_session_results(events, grid)
+            for _ in range(trials):
+                cuts = np.sort(rng.choice(np.arange(1, len(events)), size=rng.integers(0, 12), replace=False))
+                session = SessionAccumulator(grid)
+                for part in np.split(np.arange(len(events)), cuts):
+                    session.update(events.iloc[part])
+                    if rng.random() < 0.3:
+                        session.results()
+                problems = compare_results(expected, session.results())
+                if problems:
+                    failures += 1
+                    print(f'DIVERGÊNCIA streaming seed={seed} passo={grid.step:g} blocos={len(cuts) + 1}:', file=sys.stderr)
+                    for problem in problems:
+                        print(f'  {problem}', file=sys.stderr)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5, 10**6])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--check-max', type=int, default=3000, help='maior registro conferido contra a referência')
+    parser.add_argument('--check-seeds', type=int, default=3)
+    parser.add_argument('--check-only', action='store_true')
+    parser.add_argument('--json', help='grava os tempos medidos neste arquivo')
+    args = parser.parse_args(argv)
+
+    failures = run_checks(args.check_max, args.check_seeds)
+    failures += check_short_grid(args.check_seeds)
+    failures += check_time_blocks(args.check_seeds)
+    failures += check_streaming(args.check_seeds)
+    failures += run_behavior_checks()
+    print(f'Conferência com a referência: {"OK" if not failures else f"{failures} divergência(s)"}')
+    if args.check_only:
+        return 1 if failures else 0
+
+    results = {stage: [] for stage in STAGES}
+    sizes = []
+    for n_events in args.sizes:
+        raw, events, grid = make_case(n_events)
+        sizes.append(len(events))
+        for name, stage in STAGES.items():
+            results[name].append(time_stage(stage, raw, events, grid, args.repeat))
+
+    header = f'{"etapa":<36}' + ''.join(f'{n:>12,}' for n in sizes) + f'{"expoente":>10}'
+    print(header)
+    print('-' * len(header))
+    for name, seconds in results.items():
+        row = ''.join(f'{s * 1000:>10.2f}ms' for s in seconds)
+        print(f'{name:<36}{row}{scaling_exponent(sizes, seconds):>10.2f}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'sizes': sizes, 'seconds': results, 'failures': failures}, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
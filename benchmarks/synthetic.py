@@ -0,0 +1,137 @@
+"""
+Gerador reprodutível de registros de remada no formato do lb.csv.
+
+A prova é simulada remada a remada: cada remada tem uma fase aquática (Entrada ->
+Saida) e uma fase aérea (Saida -> Entrada seguinte), com lados alternados. A velocidade
+sobe da largada até a velocidade de cruzeiro e a distância de cada evento vem da
+integral da velocidade no tempo.
+"""
+import numpy as np
+import pandas as pd
+
+
+def generate_race(
+    distance=200,
+    stroke_rate=45,
+    side_asymmetry=0.0,
+    noise=0.05,
+    miss_rate=0.02,
+    cruise_speed=2.2,
+    participant='SIM',
+    test='Pre',
+    max_events=None,
+    decimal_comma=False,
+    seed=0,
+):
+    """
+    Gera uma prova sintética.
+
+    Args:
+        distance (float): Distância da prova em metros.
+        stroke_rate (float): Frequência média de remadas (remadas/min).
+        side_asymmetry (float): Diferença relativa de duração entre as remadas da
+            esquerda e da direita (0.1 = esquerda 10% mais longa).
+        noise (float): Variação relativa aleatória das durações e da velocidade.
+        miss_rate (float): Probabilidade de repetir o lado da remada anterior
+            (quebra o ciclo e gera remadas perdidas).
+        cruise_speed (float): Velocidade de cruzeiro em m/s.
+        participant (str): Valor da coluna 'Participante'.
+        test (str): Valor da coluna 'Teste'.
+        max_events (int): Corta o registro neste número de eventos.
+        decimal_comma (bool): Grava 'Distância' como texto com vírgula decimal, como no CSV.
+        seed (int): Semente do gerador aleatório.
+
+    Returns:
+        pd.DataFrame: Registro com as colunas do lb.csv.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Remadas suficientes para cobrir a distância com folga
+    stroke_time = 60 / stroke_rate
+    n_strokes = int(np.ceil(distance / (cruise_speed * stroke_time) * 1.5)) + 4
+
+    # Lados: alternados, com repetições ocasionais
+    repeat = rng.random(n_strokes) < miss_rate
+    flips = np.concatenate([[0], (~repeat[1:]).astype(int)])
+    left = (np.cumsum(flips) % 2) == 0
+
+    # Durações das fases (aquática ~55% da remada), com assimetria entre os lados
+    side_factor = np.where(left, 1 + side_asymmetry / 2, 1 - side_asymmetry / 2)
+    water = stroke_time * 0.55 * side_factor * (1 + noise * rng.standard_normal(n_strokes))
+    air = stroke_time * 0.45 * side_factor * (1 + noise * rng.standard_normal(n_strokes))
+    durations = np.column_stack([np.maximum(water, 0.05), np.maximum(air, 0.05)]).ravel()
+
+    times = np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+    times = np.round(times, 3)
+
+    # Velocidade: aceleração na largada até a velocidade de cruzeiro
+    speed = cruise_speed * (1 - np.exp(-times / 3.0)) * (1 + noise * rng.standard_normal(len(times)))
+    steps = np.maximum(speed[:-1], 0) * np.diff(times)
+    distances = np.round(np.concatenate([[0.0], np.cumsum(steps)]), 1)
+
+    # Encerrar na chegada: o último evento marca exatamente a distância final
+    end = np.searchsorted(distances, distance, side='left')
+    n_events = min(end + 1, len(distances))
+    if max_events is not None:
+        n_events = min(n_events, max_events)
+    distances = distances[:n_events]
+    times = times[:n_events]
+    if n_events == end + 1:
+        distances[-1] = distance
+
+    millis = np.round(times * 1000).astype(np.int64)
+    race = pd.DataFrame({
+        'Participante': participant,
+        'Teste': test,
+        'Pá do remo': np.where(np.repeat(left, 2)[:n_events], 'Esquerda', 'Direita'),
+        'Ação': np.tile(['Entrada', 'Saida'], n_strokes)[:n_events],
+        'Min': millis // 60000,
+        'Segundo': (millis // 1000) % 60,
+        'Milesimos': millis % 1000,
+        'Distância': distances,
+    })
+    if decimal_comma:
+        race['Distância'] = race['Distância'].map(lambda value: f'{value:g}'.replace('.', ','))
+    return race
+
+
+def generate_squad(n_participants, tests=('Pre', 'Pos'), seed=0, **race_options):
+    """Gera várias provas (participante x teste) concatenadas, com sementes derivadas de `seed`."""
+    races = []
+    for i in range(n_participants):
+        for j, test in enumerate(tests):
+            races.append(generate_race(
+                participant=f'P{i:03d}',
+                test=test,
+                seed=seed * 1_000_003 + i * len(tests) + j,
+                **race_options,
+            ))
+    return pd.concat(races, ignore_index=True)
+
+
+def corrupt_race(race, n_faults=6, seed=0):
+    """
+    Injeta falhas de registro em uma prova (formato do lb.csv) para exercitar a
+    validação: tempo ou distância ausentes, ação desconhecida, tempo adiantado ou
+    atrasado em um evento e um bloco de três eventos deslocado 20 s para trás.
+    """
+    rng = np.random.default_rng(seed)
+    race = race.copy()
+    race['Milesimos'] = race['Milesimos'].astype(float)
+    race['Distância'] = race['Distância'].astype(float)
+    for _ in range(n_faults):
+        i = int(rng.integers(1, len(race) - 3))
+        fault = rng.integers(0, 6)
+        if fault == 0:
+            race.loc[i, 'Milesimos'] = np.nan
+        elif fault == 1:
+            race.loc[i, 'Distância'] = np.nan
+        elif fault == 2:
+            race.loc[i, 'Ação'] = 'X'
+        elif fault == 3:
+            race.loc[i, 'Segundo'] += 3
+        elif fault == 4:
+            race.loc[i, 'Segundo'] -= 3
+        else:
+            race.loc[i:i + 2, 'Segundo'] -= 20
+    return race
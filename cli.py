@@ -0,0 +1,298 @@
+"""
+Linha de comando para calcular as métricas sem a interface do Streamlit.
+
+Exemplo:
+    python cli.py metrics lb.csv outra_sessao.csv --distance 200 --step 25 -o metricas.csv
+"""
+import argparse
+import os
+import sys
+
+
+def _positive_float(text):
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' não é um número") from None
+    if not 0 < value < float('inf'):
+        raise argparse.ArgumentTypeError(f"'{text}' deve ser um número finito maior que zero")
+    return value
+
+
+def _add_grid_arguments(parser):
+    parser.add_argument('--distance', type=_positive_float, default=200, help='distância da prova em metros (padrão: 200)')
+    parser.add_argument('--step', type=_positive_float, default=25, help='tamanho do trecho em metros (padrão: 25)')
+
+
+def _load_tables(args):
+    # Importado aqui para que `--help` e erros de argumento respondam sem carregar pandas
+    from stroke_metrics import iter_csv_files
+
+    if args.store:
+        from session_store import load_sessions
+        return [load_sessions(args.store, participants=args.participant, tests=args.test)]
+    if not args.csv:
+        raise SystemExit('informe arquivos CSV ou --store')
+    # Leitura em paralelo; as tabelas mantêm a ordem dos arquivos na linha de comando
+    tables = {}
+    for path, events, error in iter_csv_files((path, path) for path in args.csv):
+        if error is not None:
+            raise SystemExit(f'{path}: {error}')
+        tables[path] = events
+    return [tables[path] for path in args.csv]
+
+
+def _warn_shared_sessions(tables):
+    # O mesmo (participante, teste) em dois arquivos (p. ex. o Pré de duas datas) são
+    # duas sessões: cada arquivo é calculado separadamente, e a saída repete as chaves
+    from collections import Counter
+
+    from stroke_metrics import SESSION_KEYS
+
+    files = Counter(
+        keys
+        for events in tables
+        for keys in events[SESSION_KEYS].drop_duplicates().itertuples(index=False, name=None)
+    )
+    for (participante, teste), count in files.items():
+        if count > 1:
+            print(f'{participante} {teste}: sessão em {count} arquivos, calculada separadamente em cada um', file=sys.stderr)
+
+
+def run_metrics(args):
+    import pandas as pd
+    from profiling import StageProfiler, activate
+    from stroke_metrics import SegmentGrid, calculate_metrics_batch
+
+    profiler = None
+    workers = args.workers
+    if args.profile:
+        profiler = StageProfiler(cprofile=args.cprofile)
+        # As etapas só são medidas no próprio processo
+        workers = workers or 1
+
+    grid = SegmentGrid(args.distance, args.step)
+    with activate(profiler):
+        tables = _load_tables(args)
+        # Métricas por arquivo: o mesmo teste em dois arquivos são duas sessões
+        table = pd.concat(
+            [calculate_metrics_batch(events, grid, max_workers=workers) for events in tables],
+            ignore_index=True,
+        )
+    _warn_shared_sessions(tables)
+    table.to_csv(args.output or sys.stdout, index=False)
+
+    if profiler is not None:
+        profiler.meta = {'events': sum(len(events) for events in tables), 'distance': grid.distance, 'step': grid.step, 'workers': workers}
+        with open(args.profile, 'w') as f:
+            f.write(profiler.to_json())
+
+
+def run_validate(args):
+    import pandas as pd
+    from stroke_metrics import ANOMALY_COLUMNS, SESSION_KEYS, validate_events, with_session_keys
+
+    tables = _load_tables(args)
+    _warn_shared_sessions(tables)
+    reports = []
+    # Sessões por arquivo; 'Linha' é a linha de dados dentro do arquivo
+    for events in tables:
+        for keys, session in events.groupby(SESSION_KEYS, observed=True, sort=False):
+            _, report = validate_events(session)
+            reports.append(with_session_keys(keys, report))
+    table = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=SESSION_KEYS + ANOMALY_COLUMNS)
+    table.to_csv(args.output or sys.stdout, index=False)
+    print(f'{len(table)} anomalias em {len(reports)} sessões', file=sys.stderr)
+
+
+def run_import(args):
+    from session_store import import_csv
+
+    for path in args.csv:
+        sessions = import_csv(path, args.store)
+        print(f'{path}: {len(sessions)} sessões importadas', file=sys.stderr)
+
+
+def run_db_import(args):
+    import datetime
+
+    from session_db import DEFAULT_DB_PATH, SessionDatabase
+    from stroke_metrics import SegmentGrid, load_csv
+
+    db = SessionDatabase(args.db or DEFAULT_DB_PATH)
+    grid = SegmentGrid(args.distance, args.step)
+    for path in args.csv:
+        # Sem --date, a data do teste é a da última modificação do arquivo
+        test_date = args.date or datetime.date.fromtimestamp(os.path.getmtime(path)).isoformat()
+        status = db.insert_events(load_csv(path), test_date, grids=[grid], source=path)
+        for (participante, teste), situation in status.items():
+            print(f'{path}: {participante} {teste} {test_date}: {situation}', file=sys.stderr)
+            if args.category:
+                db.set_category(participante, args.category)
+
+
+def run_cohort(args):
+    from session_db import DEFAULT_DB_PATH, SessionDatabase
+    from stroke_metrics import SegmentGrid
+
+    db = SessionDatabase(args.db or DEFAULT_DB_PATH)
+    grid = SegmentGrid(args.distance, args.step)
+    db.ensure_metrics(grid)
+    filters = {
+        'participants': args.participant,
+        'tests': args.test,
+        'categoria': args.category,
+        'last_dates': args.last_dates,
+    }
+    if args.summary:
+        table = db.cohort_summary(args.metric, args.trecho, grid, **filters)
+    else:
+        table = db.query_metrics(args.metric, args.trecho, grid, **filters)
+    table.to_csv(args.output or sys.stdout, index=False)
+
+
+def run_compare(args):
+    import pandas as pd
+    from squad_stats import bootstrap_paired, duplicate_sessions
+    from stroke_metrics import NUMERIC_METRICS, SegmentGrid, calculate_metrics_batch
+
+    grid = SegmentGrid(args.distance, args.step)
+    # Métricas por arquivo: o mesmo teste em dois arquivos são duas sessões
+    table = pd.concat(
+        [calculate_metrics_batch(events, grid, max_workers=args.workers) for events in _load_tables(args)],
+        ignore_index=True,
+    )
+    for participante, teste, sessions in duplicate_sessions(table).itertuples(index=False):
+        print(f'{participante} {teste}: {sessions} sessões, comparadas pela média', file=sys.stderr)
+    result = bootstrap_paired(
+        table,
+        metrics=args.metric or NUMERIC_METRICS,
+        pre=args.pre,
+        pos=args.pos,
+        n_resamples=args.resamples,
+        confidence=args.confidence,
+        seed=args.seed,
+        max_workers=args.workers,
+    )
+    result.to_csv(args.output or sys.stdout, index=False)
+    print(f"{result['Atletas'].max() if len(result) else 0} atletas com {args.pre} e {args.pos}", file=sys.stderr)
+
+
+def _iter_sessions(args):
+    # Uma sessão (ou um arquivo) por vez, para que a exportação não carregue tudo
+    from stroke_metrics import SESSION_KEYS, load_csv
+
+    if args.store:
+        from session_store import list_sessions, load_sessions
+        for participante, teste in list_sessions(args.store):
+            if args.participant and participante not in args.participant:
+                continue
+            if args.test and teste not in args.test:
+                continue
+            yield (participante, teste), load_sessions(args.store, participants=[participante], tests=[teste])
+        return
+    if not args.csv:
+        raise SystemExit('informe arquivos CSV ou --store')
+    for path in args.csv:
+        events = load_csv(path)
+        yield from events.groupby(SESSION_KEYS, observed=True, sort=False)
+
+
+def run_export(args):
+    from report_export import export_results
+    from stroke_metrics import SegmentGrid, session_results
+
+    grid = SegmentGrid(args.distance, args.step)
+    sessions = ((keys, session_results(session, grid)) for keys, session in _iter_sessions(args))
+    count = export_results(sessions, args.output, args.format)
+    print(f'{count} sessões exportadas para {args.output}', file=sys.stderr)
+
+
+def _add_source_arguments(parser):
+    parser.add_argument('csv', nargs='*', help='arquivos CSV no formato do lb.csv')
+    parser.add_argument('--store', help='ler do arquivo de sessões (Parquet) em vez de CSVs')
+    parser.add_argument('--participant', action='append', help='participante a ler do arquivo (repetível)')
+    parser.add_argument('--test', action='append', help='teste a ler do arquivo (repetível)')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Análise de remadas em caiaque (sem interface).')
+    parser.add_argument('--no-cache', action='store_true', help='não usar o cache de resultados em disco')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    metrics = commands.add_parser('metrics', help='calcula as métricas por trecho de cada sessão')
+    _add_source_arguments(metrics)
+    _add_grid_arguments(metrics)
+    metrics.add_argument('--workers', type=int, default=None, help='número de processos (padrão: todos os núcleos)')
+    metrics.add_argument('-o', '--output', help='arquivo CSV de saída (padrão: saída padrão)')
+    metrics.add_argument('--profile', metavar='JSON', help='grava o tempo, linhas e pico de memória de cada etapa (com 1 processo, salvo --workers; com mais processos só a leitura dos CSVs é medida)')
+    metrics.add_argument('--cprofile', action='store_true', help='inclui o perfil do cProfile no JSON de --profile')
+    metrics.set_defaults(func=run_metrics)
+
+    compare = commands.add_parser('compare', help='diferença Pré x Pós do grupo com IC por bootstrap e tamanho de efeito')
+    _add_source_arguments(compare)
+    _add_grid_arguments(compare)
+    compare.add_argument('--metric', action='append', help='métrica a comparar (repetível; padrão: todas)')
+    compare.add_argument('--pre', default='Pre', help='rótulo do teste inicial (padrão: Pre)')
+    compare.add_argument('--pos', default='Pos', help='rótulo do teste final (padrão: Pos)')
+    compare.add_argument('--resamples', type=int, default=10_000, help='número de reamostragens (padrão: 10000)')
+    compare.add_argument('--confidence', type=float, default=0.95, help='nível de confiança (padrão: 0.95)')
+    compare.add_argument('--seed', type=int, default=0, help='semente das reamostragens (padrão: 0)')
+    compare.add_argument('--workers', type=int, default=1, help='número de processos (padrão: 1)')
+    compare.add_argument('-o', '--output', help='arquivo CSV de saída (padrão: saída padrão)')
+    compare.set_defaults(func=run_compare)
+
+    export = commands.add_parser('export', help='exporta métricas, parciais e fases de cada sessão (Excel, Parquet ou CSV)')
+    _add_source_arguments(export)
+    _add_grid_arguments(export)
+    export.add_argument('--format', choices=['xlsx', 'parquet', 'csv'], default='xlsx', help='formato de saída (padrão: xlsx)')
+    export.add_argument('-o', '--output', required=True, help='arquivo .xlsx, ou diretório de saída no Parquet e no CSV')
+    export.set_defaults(func=run_export)
+
+    validate = commands.add_parser('validate', help='relatório de anomalias (linha, regra, gravidade) de cada sessão')
+    _add_source_arguments(validate)
+    validate.add_argument('-o', '--output', help='arquivo CSV de saída (padrão: saída padrão)')
+    validate.set_defaults(func=run_validate)
+
+    importer = commands.add_parser('import', help='converte CSVs para o arquivo de sessões (Parquet)')
+    importer.add_argument('csv', nargs='+', help='arquivos CSV no formato do lb.csv')
+    importer.add_argument('--store', default='sessions', help='diretório do arquivo de sessões (padrão: sessions)')
+    importer.set_defaults(func=run_import)
+
+    db_import = commands.add_parser('db-import', help='grava CSVs e suas métricas no banco de sessões (SQLite)')
+    db_import.add_argument('csv', nargs='+', help='arquivos CSV no formato do lb.csv')
+    db_import.add_argument('--db', default=None, help='arquivo do banco (padrão: PARACANUE_DB ou paracanue.sqlite)')
+    db_import.add_argument('--date', help='data dos testes (AAAA-MM-DD; padrão: data de modificação do arquivo)')
+    db_import.add_argument('--category', help='categoria dos atletas importados (p. ex. U18)')
+    _add_grid_arguments(db_import)
+    db_import.set_defaults(func=run_db_import)
+
+    cohort = commands.add_parser('cohort', help='consulta uma métrica por trecho no banco de sessões')
+    cohort.add_argument('--db', default=None, help='arquivo do banco (padrão: PARACANUE_DB ou paracanue.sqlite)')
+    cohort.add_argument('--metric', default='Vel Média (m/s)', help="coluna das métricas (padrão: 'Vel Média (m/s)')")
+    cohort.add_argument('--trecho', help='rótulo do trecho, p. ex. 0-25m (padrão: todos)')
+    cohort.add_argument('--participant', action='append', help='participante (repetível)')
+    cohort.add_argument('--test', action='append', help='teste, p. ex. Pre (repetível)')
+    cohort.add_argument('--category', help='categoria dos atletas')
+    cohort.add_argument('--last-dates', type=int, help='apenas as N datas de teste mais recentes')
+    cohort.add_argument('--summary', action='store_true', help='média, desvio e contagem por data e teste')
+    cohort.add_argument('-o', '--output', help='arquivo CSV de saída (padrão: saída padrão)')
+    _add_grid_arguments(cohort)
+    cohort.set_defaults(func=run_cohort)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'step', None) is not None and args.step > args.distance:
+        parser.error(f'--step ({args.step:g}) não pode ser maior que --distance ({args.distance:g})')
+    if args.no_cache:
+        # Herdado pelos processos do pool
+        os.environ['PARACANUE_CACHE_PATH'] = ''
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
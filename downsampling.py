@@ -0,0 +1,65 @@
+"""
+Redução do número de pontos de séries longas antes de desenhá-las.
+
+O navegador fica lento com centenas de milhares de pontos em um gráfico; o
+Largest-Triangle-Three-Buckets (LTTB) escolhe um ponto por faixa preservando picos e
+vales, de modo que a forma da curva se mantém com alguns milhares de pontos.
+"""
+import numpy as np
+
+# Pontos por traço exibidos nos gráficos de séries
+MAX_POINTS = 2000
+
+
+def lttb_indices(x, y, n_out=MAX_POINTS):
+    """
+    Índices dos pontos escolhidos pelo LTTB (em ordem crescente).
+
+    Args:
+        x (array-like): Abscissas, em ordem crescente.
+        y (array-like): Valores da série.
+        n_out (int): Número de pontos desejado (o primeiro e o último são sempre mantidos).
+
+    Returns:
+        np.ndarray: Índices em `x`/`y`; pontos com valor ausente ou infinito são ignorados.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    n = len(finite)
+    if n <= n_out or n_out < 3:
+        return finite
+    x = x[finite]
+    y = y[finite]
+
+    # Faixas entre o primeiro e o último ponto; médias das faixas por somas acumuladas
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    sum_x = np.concatenate([[0.0], np.cumsum(x)])
+    sum_y = np.concatenate([[0.0], np.cumsum(y)])
+
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_lo, next_hi = hi, edges[bucket + 2]
+            avg_x = (sum_x[next_hi] - sum_x[next_lo]) / (next_hi - next_lo)
+            avg_y = (sum_y[next_hi] - sum_y[next_lo]) / (next_hi - next_lo)
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+
+        # Área do triângulo (ponto escolhido antes, candidato, média da faixa seguinte)
+        area = np.abs(
+            (x[previous] - avg_x) * (y[lo:hi] - y[previous]) -
+            (x[previous] - x[lo:hi]) * (avg_y - y[previous])
+        )
+        previous = lo + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return finite[selected]
+
+
+def downsample(frame, x, y, n_out=MAX_POINTS):
+    """Linhas de `frame` escolhidas pelo LTTB sobre as colunas `x` e `y`."""
+    return frame.iloc[lttb_indices(frame[x].to_numpy(), frame[y].to_numpy(), n_out)]
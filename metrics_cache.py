@@ -0,0 +1,135 @@
+"""
+Cache persistente em disco dos resultados por sessão (tabelas de métricas e tempos de
+passagem), compartilhado entre reinícios do app e entre processos do Streamlit.
+
+Os resultados ficam em um banco SQLite em modo WAL, que permite vários leitores
+simultâneos enquanto um processo grava. As leituras não escrevem: os horários de
+acesso são guardados em memória e gravados em lote. O tamanho total é limitado e
+mantido por gatilhos; ao passar do limite, as entradas acessadas há mais tempo são
+descartadas (LRU).
+"""
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import closing
+
+from sqlite_util import connect
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'paracanue', 'metrics.sqlite')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Resolução (s) do horário de acesso e quantidade de acessos gravados de uma vez
+ACCESS_RESOLUTION = 60
+TOUCH_BATCH = 64
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS entries ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' size INTEGER NOT NULL,'
+    ' last_access REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)',
+    # Tamanho total das entradas, atualizado a cada gravação (sem varrer a tabela)
+    'CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    "INSERT OR IGNORE INTO stats (name, value) SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM entries",
+    'CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN'
+    " UPDATE stats SET value = value + NEW.size WHERE name = 'total_bytes'; END",
+    'CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN'
+    " UPDATE stats SET value = value + NEW.size - OLD.size WHERE name = 'total_bytes'; END",
+    'CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN'
+    " UPDATE stats SET value = value - OLD.size WHERE name = 'total_bytes'; END",
+]
+
+
+class MetricsCache:
+    """
+    Armazenamento chave -> objeto (serializado com pickle) com limite de tamanho.
+
+    Args:
+        path (str): Caminho do arquivo SQLite (o diretório é criado se necessário).
+        max_bytes (int): Tamanho máximo somado dos valores armazenados.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._touched = {}  # chave -> horário de acesso ainda não gravado
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        return connect(self.path)
+
+    def get(self, key, default=None):
+        """
+        Retorna o valor armazenado em `key` (ou `default`). Só lê o banco: o acesso é
+        anotado em memória (com resolução de ACCESS_RESOLUTION s) e gravado em lote.
+        """
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute('SELECT value, last_access FROM entries WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error:
+            return default
+        if row is None:
+            return default
+        now = time.time()
+        if now - row[1] >= ACCESS_RESOLUTION:
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_BATCH:
+                self.flush_access()
+        return pickle.loads(row[0])
+
+    def flush_access(self, conn=None):
+        """Grava os horários de acesso anotados por get (também feito a cada put)."""
+        touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        rows = [(when, key) for key, when in touched.items()]
+        try:
+            if conn is not None:
+                conn.executemany('UPDATE entries SET last_access = max(last_access, ?) WHERE key = ?', rows)
+                return
+            with closing(self._connect()) as conn, conn:
+                conn.executemany('UPDATE entries SET last_access = max(last_access, ?) WHERE key = ?', rows)
+        except sqlite3.Error:
+            # Só afeta a ordem de descarte; os acessos voltam a ser anotados
+            pass
+
+    def put(self, key, value):
+        """Armazena `value` em `key` e descarta as entradas mais antigas se o limite for excedido."""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            with closing(self._connect()) as conn, conn:
+                self.flush_access(conn)
+                conn.execute(
+                    'INSERT INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)'
+                    ' ON CONFLICT (key) DO UPDATE SET'
+                    ' value = excluded.value, size = excluded.size, last_access = excluded.last_access',
+                    (key, blob, len(blob), time.time()),
+                )
+                total = conn.execute("SELECT value FROM stats WHERE name = 'total_bytes'").fetchone()[0]
+                if total > self.max_bytes:
+                    self._evict(conn, total)
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, conn, total):
+        # Das entradas acessadas há mais tempo para as mais recentes (pelo índice), só
+        # até o total voltar ao limite
+        expired = []
+        cursor = conn.execute('SELECT key, size FROM entries ORDER BY last_access')
+        for key, size in cursor:
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        cursor.close()
+        conn.executemany('DELETE FROM entries WHERE key = ?', expired)
+
+    def clear(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM entries')
@@ -0,0 +1,182 @@
+"""
+Instrumentação leve das etapas do cálculo: tempo de parede, número de linhas e pico de
+memória de cada chamada, com captura opcional do cProfile.
+
+As etapas são marcadas com o decorador `profiled` ou com o contexto `stage`. Sem um
+medidor ativo (ver `activate`) o custo é só a consulta a uma ContextVar, então a
+marcação pode ficar no código de produção. O padrão vem de PARACANUE_PROFILE:
+vazio desativa, '1' mede as etapas e 'cprofile' captura também o cProfile.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import wraps
+
+PROFILE_FLAG = os.environ.get('PARACANUE_PROFILE', '').strip().lower()
+PROFILE_ENABLED = PROFILE_FLAG not in ('', '0', 'false', 'no')
+
+# Medidor da execução corrente (cada thread do Streamlit tem o seu contexto)
+_active = ContextVar('paracanue_profiler', default=None)
+
+
+class StageProfiler:
+    """
+    Registro das etapas executadas enquanto o medidor está ativo.
+
+    Pode ser usado por várias threads ao mesmo tempo (p. ex. a leitura paralela de
+    iter_csv_files, que propaga o contexto): cada thread tem a sua pilha de etapas. O
+    tempo e as linhas de etapas simultâneas são exatos, mas o pico de memória do
+    tracemalloc é do processo e se mistura entre elas.
+
+    Args:
+        memory (bool): Medir o pico de memória de cada etapa com tracemalloc.
+        cprofile (bool): Capturar também o perfil completo com cProfile.
+    """
+
+    def __init__(self, memory=True, cprofile=False):
+        self.memory = memory
+        self.cprofile = cprofile
+        self.records = []
+        self.meta = {}
+        self.stats_text = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def _frames(self):
+        # Pilha das etapas abertas na thread corrente
+        frames = getattr(self._local, 'frames', None)
+        if frames is None:
+            frames = self._local.frames = []
+        return frames
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Mede o bloco como uma chamada da etapa `name` sobre `rows` linhas."""
+        tracing = self.memory and tracemalloc.is_tracing()
+        frame = {'inner_peak': 0}
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # O pico acumulado até aqui pertence à etapa externa, se houver
+            if self._frames:
+                self._frames[-1]['inner_peak'] = max(self._frames[-1]['inner_peak'], peak)
+            tracemalloc.reset_peak()
+            frame['start'] = current
+        self._frames.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._frames.pop()
+            record = {'stage': name, 'seconds': seconds, 'rows': rows, 'depth': len(self._frames)}
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], frame['inner_peak'])
+                record['peak_bytes'] = max(peak - frame['start'], 0)
+                if self._frames:
+                    self._frames[-1]['inner_peak'] = max(self._frames[-1]['inner_peak'], peak)
+            with self._lock:
+                self.records.append(record)
+
+    def summary(self):
+        """Uma linha por etapa: chamadas, tempo total/médio/máximo, linhas e pico de memória."""
+        stages = {}
+        for record in self.records:
+            row = stages.setdefault(record['stage'], {
+                'stage': record['stage'],
+                'calls': 0,
+                'total_s': 0.0,
+                'max_s': 0.0,
+                'rows': 0,
+                'peak_bytes': None,
+            })
+            row['calls'] += 1
+            row['total_s'] += record['seconds']
+            row['max_s'] = max(row['max_s'], record['seconds'])
+            row['rows'] += record['rows'] or 0
+            if 'peak_bytes' in record:
+                row['peak_bytes'] = max(row['peak_bytes'] or 0, record['peak_bytes'])
+        for row in stages.values():
+            row['mean_s'] = row['total_s'] / row['calls']
+        return sorted(stages.values(), key=lambda row: row['total_s'], reverse=True)
+
+    def to_dict(self):
+        return {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'meta': self.meta,
+            'summary': self.summary(),
+            'records': self.records,
+            'cprofile': self.stats_text,
+        }
+
+    def to_json(self, indent=2):
+        """Exporta as medições em JSON (para acompanhar o custo por tamanho de sessão)."""
+        return json.dumps(self.to_dict(), indent=indent, default=str)
+
+
+def stage(name, rows=None):
+    """Contexto que mede o bloco no medidor ativo (sem efeito se não houver medidor)."""
+    profiler = _active.get()
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name, rows)
+
+
+def profiled(name=None):
+    """Decorador que mede cada chamada da função; as linhas são o len() do primeiro argumento."""
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active.get()
+            if profiler is None:
+                return func(*args, **kwargs)
+            rows = len(args[0]) if args and hasattr(args[0], '__len__') else None
+            with profiler.stage(stage_name, rows):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def activate(profiler):
+    """
+    Ativa o medidor durante o bloco (com profiler=None nada é medido). Liga o
+    tracemalloc e o cProfile conforme a configuração do medidor e os desliga ao final.
+    """
+    if profiler is None:
+        yield None
+        return
+
+    started_tracing = profiler.memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    capture = None
+    if profiler.cprofile:
+        capture = cProfile.Profile()
+        try:
+            capture.enable()
+        except ValueError:
+            # Outro profiler já ativo no processo (p. ex. um depurador)
+            capture = None
+    token = _active.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _active.reset(token)
+        if capture is not None:
+            capture.disable()
+            out = io.StringIO()
+            pstats.Stats(capture, stream=out).sort_stats('cumulative').print_stats(40)
+            profiler.stats_text = out.getvalue()
+        if started_tracing:
+            tracemalloc.stop()
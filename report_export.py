@@ -0,0 +1,222 @@
+"""
+Exportação em lote dos resultados das sessões para Excel, Parquet e CSV.
+
+As sessões são consumidas uma a uma (p. ex. de um gerador sobre session_results, que
+reaproveita o cache de resultados) e cada uma é gravada antes de ler a próxima, então a
+memória não cresce com o número de sessões:
+
+- CSV: um arquivo por tabela, com as linhas de cada sessão acrescentadas ao final;
+- Parquet: um arquivo por tabela, com um row group por sessão;
+- Excel: uma planilha por atleta, no modo de escrita do openpyxl (as linhas vão para
+  arquivos temporários até o fechamento).
+
+O Parquet requer o pacote opcional pyarrow e o Excel o pacote opcional openpyxl.
+"""
+import io
+import math
+import os
+import re
+import tempfile
+import zipfile
+
+import pandas as pd
+
+from session_store import require_pyarrow
+from stroke_metrics import SESSION_KEYS, with_session_keys
+
+EXPORT_FORMATS = ['xlsx', 'parquet', 'csv']
+
+# Tabelas exportadas de cada sessão, na ordem em que aparecem na planilha do atleta
+EXPORT_TABLES = ['metricas', 'parciais', 'fases']
+
+# Colunas do detalhamento das fases (subconjunto das tabelas de métricas)
+PHASE_COLUMNS = ['Trecho', 'Tempo (s)', 'Fase aérea', 'Fase aquática', 'Fase aérea %', 'Fase aquática %']
+
+# Limite do Excel para o nome de uma planilha e caracteres proibidos
+SHEET_NAME_MAX = 31
+_SHEET_FORBIDDEN = re.compile(r'[\[\]:*?/\\]')
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError as exc:
+        raise ImportError("A exportação em Excel requer o pacote 'openpyxl' (pip install openpyxl).") from exc
+    return openpyxl
+
+
+def split_table(splits):
+    """Tempos de passagem ({posição: tempo}) como tabela, com o tempo parcial de cada trecho."""
+    table = pd.DataFrame({'Posição (m)': list(splits), 'Tempo (s)': list(splits.values())}, dtype=float)
+    table['Parcial (s)'] = table['Tempo (s)'].diff()
+    return table
+
+
+def session_tables(results):
+    """Tabelas exportadas (EXPORT_TABLES) a partir dos resultados de uma sessão."""
+    metrics = pd.concat([results['metrics'], results['totais']], ignore_index=True)
+    return {
+        'metricas': metrics,
+        'parciais': split_table(results['splits']),
+        'fases': metrics[PHASE_COLUMNS],
+    }
+
+
+def _key_strings(keys):
+    # Chaves como texto, para o mesmo tipo de coluna em todas as sessões exportadas
+    return [str(value) for value in keys]
+
+
+class CsvExporter:
+    """Um CSV por tabela no diretório `destination`, acrescentado sessão a sessão."""
+
+    def __init__(self, destination):
+        os.makedirs(destination, exist_ok=True)
+        self.destination = destination
+        self._files = {}
+
+    def write(self, keys, tables):
+        for name, table in tables.items():
+            f = self._files.get(name)
+            header = f is None
+            if header:
+                f = self._files[name] = open(os.path.join(self.destination, f'{name}.csv'), 'w', newline='')
+            with_session_keys(_key_strings(keys), table).to_csv(f, header=header, index=False)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+
+class ParquetExporter:
+    """Um Parquet por tabela no diretório `destination`, com um row group por sessão."""
+
+    def __init__(self, destination):
+        self._pa, self._pq = require_pyarrow()
+        os.makedirs(destination, exist_ok=True)
+        self.destination = destination
+        self._writers = {}
+
+    def write(self, keys, tables):
+        for name, table in tables.items():
+            writer = self._writers.get(name)
+            # O esquema da primeira sessão vale para as seguintes
+            schema = writer.schema if writer is not None else None
+            data = self._pa.Table.from_pandas(with_session_keys(_key_strings(keys), table), schema=schema, preserve_index=False)
+            if writer is None:
+                path = os.path.join(self.destination, f'{name}.parquet')
+                writer = self._writers[name] = self._pq.ParquetWriter(path, data.schema)
+            writer.write_table(data)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+
+
+def sheet_name(participante, used):
+    """Nome de planilha válido e único para o participante."""
+    base = _SHEET_FORBIDDEN.sub('_', str(participante)).strip("'") or 'Participante'
+    name = base[:SHEET_NAME_MAX]
+    suffix = 2
+    while name.lower() in used:
+        tail = f' ({suffix})'
+        name = base[:SHEET_NAME_MAX - len(tail)] + tail
+        suffix += 1
+    used.add(name.lower())
+    return name
+
+
+def _excel_rows(table):
+    yield list(table.columns)
+    for row in table.itertuples(index=False, name=None):
+        yield [None if isinstance(value, float) and math.isnan(value) else value for value in row]
+
+
+class ExcelExporter:
+    """
+    Pasta de trabalho com uma planilha por atleta; cada sessão é um bloco com o nome do
+    teste seguido das tabelas de métricas, parciais e fases.
+    """
+
+    def __init__(self, destination):
+        openpyxl = _openpyxl()
+        self.destination = destination
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheets = {}
+        self._used = set()
+
+    def write(self, keys, tables):
+        participante, teste = keys
+        sheet = self._sheets.get(participante)
+        if sheet is None:
+            sheet = self._sheets[participante] = self._workbook.create_sheet(sheet_name(participante, self._used))
+        else:
+            sheet.append([])
+        sheet.append([f'{SESSION_KEYS[1]}: {teste}'])
+        for name in EXPORT_TABLES:
+            sheet.append([name])
+            for row in _excel_rows(tables[name]):
+                sheet.append(row)
+            sheet.append([])
+
+    def close(self):
+        if not self._sheets:
+            # O Excel não abre pastas de trabalho sem planilhas
+            self._workbook.create_sheet('Vazio')
+        self._workbook.save(self.destination)
+
+
+EXPORTERS = {
+    'xlsx': ExcelExporter,
+    'parquet': ParquetExporter,
+    'csv': CsvExporter,
+}
+
+
+def export_results(sessions, destination, fmt):
+    """
+    Grava os resultados de várias sessões em um único passo.
+
+    Args:
+        sessions: Iterável de ((participante, teste), resultados), com os resultados no
+            formato de session_results; é consumido uma sessão por vez.
+        destination (str): Arquivo .xlsx (ou objeto de arquivo binário) no Excel;
+            diretório de saída no Parquet e no CSV (um arquivo por tabela).
+        fmt (str): Um de EXPORT_FORMATS.
+
+    Returns:
+        int: Número de sessões exportadas.
+    """
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Formato '{fmt}' desconhecido (use um de {', '.join(EXPORT_FORMATS)}).")
+    exporter = EXPORTERS[fmt](destination)
+    count = 0
+    try:
+        for keys, results in sessions:
+            exporter.write(keys, session_tables(results))
+            count += 1
+    finally:
+        exporter.close()
+    return count
+
+
+def export_bytes(sessions, fmt):
+    """
+    Exportação para download: o .xlsx em si, ou um .zip com os arquivos por tabela
+    no Parquet e no CSV.
+
+    Returns:
+        tuple: (conteúdo em bytes, extensão do arquivo).
+    """
+    if fmt == 'xlsx':
+        out = io.BytesIO()
+        export_results(sessions, out, fmt)
+        return out.getvalue(), 'xlsx'
+
+    out = io.BytesIO()
+    with tempfile.TemporaryDirectory() as directory:
+        export_results(sessions, directory, fmt)
+        with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for filename in sorted(os.listdir(directory)):
+                archive.write(os.path.join(directory, filename), filename)
+    return out.getvalue(), 'zip'
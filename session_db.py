@@ -0,0 +1,297 @@
+"""
+Banco local (SQLite) de sessões para consultas longitudinais entre atletas.
+
+Guarda os eventos normalizados de cada sessão (participante x teste x data) e as
+métricas por trecho já calculadas para cada grade. As tabelas são indexadas por
+participante, data do teste, rótulo do teste e trecho, de modo que consultas como
+"velocidade média no 0-25m dos atletas U18 nas últimas seis datas" leem só os índices
+e as linhas necessárias, sem reabrir os CSVs.
+
+A inserção é incremental: uma sessão já gravada com o mesmo conteúdo é mantida, e
+uma sessão com conteúdo diferente na mesma data é substituída.
+"""
+import os
+from contextlib import closing
+from itertools import repeat
+
+import pandas as pd
+
+from sqlite_util import connect
+from stroke_metrics import NUMERIC_METRICS, SESSION_KEYS, SegmentGrid, session_hash, session_results, with_session_keys
+
+DEFAULT_DB_PATH = os.environ.get('PARACANUE_DB', 'paracanue.sqlite')
+
+# Trecho usado para a linha de totais da sessão
+TOTAL_SEGMENT = -1
+
+EVENT_FIELDS = ['t_seconds', 'distance', 'action', 'side']
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS athletes ('
+    ' participante TEXT PRIMARY KEY,'
+    ' categoria TEXT)',
+    'CREATE TABLE IF NOT EXISTS sessions ('
+    ' id INTEGER PRIMARY KEY,'
+    ' participante TEXT NOT NULL,'
+    ' teste TEXT NOT NULL,'
+    ' test_date TEXT NOT NULL,'
+    ' content_hash TEXT NOT NULL,'
+    ' n_events INTEGER NOT NULL,'
+    ' source TEXT,'
+    ' UNIQUE (participante, teste, test_date))',
+    'CREATE INDEX IF NOT EXISTS sessions_date ON sessions (test_date, participante)',
+    'CREATE INDEX IF NOT EXISTS sessions_test ON sessions (teste, test_date)',
+    'CREATE TABLE IF NOT EXISTS events ('
+    ' session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,'
+    ' seq INTEGER NOT NULL,'
+    ' t_seconds REAL,'
+    ' distance REAL,'
+    ' action INTEGER NOT NULL,'
+    ' side INTEGER NOT NULL,'
+    ' PRIMARY KEY (session_id, seq)) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS segment_metrics ('
+    ' session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,'
+    ' distance REAL NOT NULL,'
+    ' step REAL NOT NULL,'
+    ' segment INTEGER NOT NULL,'
+    ' trecho TEXT NOT NULL,'
+    + ''.join(f' {_quote(column)} REAL,' for column in NUMERIC_METRICS) +
+    ' PRIMARY KEY (session_id, distance, step, segment))',
+    'CREATE INDEX IF NOT EXISTS segment_metrics_trecho ON segment_metrics (trecho, distance, step, session_id)',
+]
+
+
+class SessionDatabase:
+    """
+    Banco de sessões em um arquivo SQLite.
+
+    Args:
+        path (str): Caminho do arquivo (o diretório é criado se necessário).
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        return connect(self.path, foreign_keys=True)
+
+    def insert_events(self, events, test_date, grids=(SegmentGrid(),), source=None):
+        """
+        Grava as sessões de uma tabela de eventos normalizada e as métricas por trecho
+        de cada grade.
+
+        Args:
+            events (pd.DataFrame): Tabela de eventos (ver normalize_events), com uma ou
+                mais sessões.
+            test_date (str): Data dos testes no formato ISO (AAAA-MM-DD).
+            grids (iterable): Grades de trechos cujas métricas são pré-calculadas.
+            source (str): Origem dos dados (p. ex. o caminho do CSV).
+
+        Returns:
+            dict: Situação de cada sessão (participante, teste): 'inserida',
+            'substituída' ou 'sem alteração'.
+        """
+        test_date = pd.Timestamp(test_date).date().isoformat()
+        status = {}
+        with closing(self._connect()) as conn, conn:
+            for keys, session in events.groupby(SESSION_KEYS, observed=True, sort=False):
+                participante, teste = (str(key) for key in keys)
+                content_hash = session_hash(session[EVENT_FIELDS])
+                row = conn.execute(
+                    'SELECT id, content_hash FROM sessions WHERE participante = ? AND teste = ? AND test_date = ?',
+                    (participante, teste, test_date),
+                ).fetchone()
+                if row is not None and row[1] == content_hash:
+                    status[keys] = 'sem alteração'
+                    session_id = row[0]
+                else:
+                    if row is not None:
+                        conn.execute('DELETE FROM sessions WHERE id = ?', (row[0],))
+                    status[keys] = 'substituída' if row is not None else 'inserida'
+                    session_id = self._insert_session(conn, participante, teste, test_date, content_hash, session, source)
+                conn.execute('INSERT OR IGNORE INTO athletes (participante) VALUES (?)', (participante,))
+                for grid in grids:
+                    self._insert_metrics(conn, session_id, session, grid)
+        return status
+
+    def _insert_session(self, conn, participante, teste, test_date, content_hash, session, source):
+        cursor = conn.execute(
+            'INSERT INTO sessions (participante, teste, test_date, content_hash, n_events, source)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (participante, teste, test_date, content_hash, len(session), source),
+        )
+        session_id = cursor.lastrowid
+        # Valores ausentes (NaN) são gravados como NULL pelo SQLite
+        conn.executemany(
+            'INSERT INTO events (session_id, seq, t_seconds, distance, action, side) VALUES (?, ?, ?, ?, ?, ?)',
+            zip(
+                repeat(session_id),
+                range(len(session)),
+                session['t_seconds'].to_numpy(dtype=float).tolist(),
+                session['distance'].to_numpy(dtype=float).tolist(),
+                session['action'].to_numpy(dtype=int).tolist(),
+                session['side'].to_numpy(dtype=int).tolist(),
+            ),
+        )
+        return session_id
+
+    def _insert_metrics(self, conn, session_id, session, grid):
+        exists = conn.execute(
+            'SELECT 1 FROM segment_metrics WHERE session_id = ? AND distance = ? AND step = ? LIMIT 1',
+            (session_id, grid.distance, grid.step),
+        ).fetchone()
+        if exists:
+            return
+        results = session_results(session.reset_index(drop=True), grid)
+        metrics = results['metrics']
+        positions = {label: i for i, label in enumerate(grid.labels)}
+        segments = [positions[label] for label in metrics['Trecho']]
+        table = pd.concat([metrics, results['totais']], ignore_index=True)
+        table.insert(0, 'segment', segments + [TOTAL_SEGMENT])
+
+        columns = ['session_id', 'distance', 'step', 'segment', 'trecho'] + NUMERIC_METRICS
+        placeholders = ', '.join('?' * len(columns))
+        conn.executemany(
+            f'INSERT INTO segment_metrics ({", ".join(map(_quote, columns))}) VALUES ({placeholders})',
+            (
+                (session_id, grid.distance, grid.step, int(row[0]), row[1], *map(float, row[2:]))
+                for row in table[['segment', 'Trecho'] + NUMERIC_METRICS].itertuples(index=False, name=None)
+            ),
+        )
+
+    def ensure_metrics(self, grid):
+        """Calcula e grava as métricas da grade para as sessões que ainda não as têm."""
+        with closing(self._connect()) as conn:
+            missing = [
+                row[0] for row in conn.execute(
+                    'SELECT id FROM sessions WHERE id NOT IN'
+                    ' (SELECT session_id FROM segment_metrics WHERE distance = ? AND step = ?)',
+                    (grid.distance, grid.step),
+                )
+            ]
+        for session_id in missing:
+            session = self.load_events(session_id)
+            with closing(self._connect()) as conn, conn:
+                self._insert_metrics(conn, session_id, session, grid)
+        return len(missing)
+
+    def set_category(self, participante, categoria):
+        """Define a categoria do atleta (p. ex. 'U18') usada para filtrar coortes."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'INSERT INTO athletes (participante, categoria) VALUES (?, ?)'
+                ' ON CONFLICT (participante) DO UPDATE SET categoria = excluded.categoria',
+                (participante, categoria),
+            )
+
+    def categories(self):
+        """Categorias de atletas definidas no banco."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT DISTINCT categoria FROM athletes WHERE categoria IS NOT NULL ORDER BY categoria')
+            return [row[0] for row in rows]
+
+    def sessions(self, participants=None, tests=None, categoria=None):
+        """Sessões gravadas (sem os eventos), ordenadas por data."""
+        conditions, params = _session_filters(participants, tests, categoria)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                'SELECT s.id, s.participante, s.teste, s.test_date, s.n_events, a.categoria, s.source, s.content_hash'
+                ' FROM sessions s JOIN athletes a USING (participante)'
+                f'{where} ORDER BY s.test_date, s.participante, s.teste',
+                conn,
+                params=params,
+            )
+
+    def load_events(self, session_id):
+        """Eventos de uma sessão como tabela normalizada (ver normalize_events)."""
+        with closing(self._connect()) as conn:
+            keys = conn.execute('SELECT participante, teste FROM sessions WHERE id = ?', (session_id,)).fetchone()
+            events = pd.read_sql_query(
+                'SELECT t_seconds, distance, action, side FROM events WHERE session_id = ? ORDER BY seq',
+                conn,
+                params=(session_id,),
+            )
+        if keys is None:
+            raise KeyError(f'sessão {session_id} não encontrada')
+        events = events.astype({'t_seconds': float, 'distance': 'float32', 'action': 'int8', 'side': 'int8'})
+        return with_session_keys(keys, events).astype({key: 'category' for key in SESSION_KEYS})
+
+    def query_metrics(self, metric, trecho=None, grid=SegmentGrid(), participants=None, tests=None, categoria=None, last_dates=None):
+        """
+        Valor de uma métrica por sessão e trecho, com filtros de coorte.
+
+        Args:
+            metric (str): Coluna de METRIC_COLUMNS (p. ex. 'Vel Média (m/s)').
+            trecho (str): Rótulo do trecho (p. ex. '0-25m'; grid.total_label para o
+                total). Padrão: todos os trechos.
+            grid (SegmentGrid): Grade das métricas pré-calculadas.
+            participants, tests (list): Participantes e rótulos de teste (padrão: todos).
+            categoria (str): Categoria dos atletas (ver set_category).
+            last_dates (int): Limita às N datas de teste mais recentes da coorte.
+
+        Returns:
+            pd.DataFrame: participante, categoria, teste, test_date, trecho e a métrica.
+        """
+        if metric not in NUMERIC_METRICS:
+            raise ValueError(f'métrica desconhecida: {metric!r}')
+        session_conditions, session_params = _session_filters(participants, tests, categoria)
+        conditions = ['m.distance = ?', 'm.step = ?'] + session_conditions
+        params = [grid.distance, grid.step] + session_params
+        if trecho is not None:
+            conditions.append('m.trecho = ?')
+            params.append(trecho)
+        if last_dates is not None:
+            # As N datas mais recentes entre as sessões da coorte
+            subquery = 'SELECT DISTINCT s.test_date FROM sessions s JOIN athletes a USING (participante)'
+            if session_conditions:
+                subquery += ' WHERE ' + ' AND '.join(session_conditions)
+            conditions.append(f's.test_date IN ({subquery} ORDER BY s.test_date DESC LIMIT ?)')
+            params += session_params + [int(last_dates)]
+
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f'SELECT s.participante, a.categoria, s.teste, s.test_date, m.trecho, m.{_quote(metric)}'
+                ' FROM segment_metrics m'
+                ' JOIN sessions s ON s.id = m.session_id'
+                ' JOIN athletes a USING (participante)'
+                f' WHERE {" AND ".join(conditions)}'
+                ' ORDER BY s.test_date, s.participante, s.teste, m.segment',
+                conn,
+                params=params,
+            )
+
+    def cohort_summary(self, metric, trecho, grid=SegmentGrid(), **filters):
+        """Média, desvio, mínimo, máximo e número de atletas da métrica por data e teste."""
+        values = self.query_metrics(metric, trecho, grid, **filters)
+        return (
+            values.groupby(['test_date', 'teste'], sort=True)[metric]
+            .agg(['mean', 'std', 'min', 'max', 'count'])
+            .reset_index()
+        )
+
+
+def _session_filters(participants, tests, categoria):
+    conditions, params = [], []
+    if participants is not None:
+        participants = list(participants)
+        conditions.append(f's.participante IN ({", ".join("?" * len(participants))})')
+        params += participants
+    if tests is not None:
+        tests = list(tests)
+        conditions.append(f's.teste IN ({", ".join("?" * len(tests))})')
+        params += tests
+    if categoria is not None:
+        conditions.append('a.categoria = ?')
+        params.append(categoria)
+    return conditions, params
@@ -0,0 +1,125 @@
+"""
+Arquivo de sessões em Parquet, particionado por participante e teste.
+
+A importação converte cada CSV uma única vez para a tabela de eventos tipada
+(normalize_events). As leituras usam memory map e trazem só as partições (linhas) e as
+colunas pedidas, sem reprocessar texto.
+
+Requer o pacote opcional pyarrow.
+"""
+import os
+from urllib.parse import unquote
+
+from stroke_metrics import SESSION_KEYS, load_csv
+
+# Colunas da tabela de eventos normalizada, na ordem de normalize_events
+EVENT_COLUMNS = SESSION_KEYS + ['t_seconds', 'distance', 'action', 'side']
+
+DEFAULT_STORE = os.environ.get('PARACANUE_STORE', 'sessions')
+
+
+def require_pyarrow():
+    """Módulos pyarrow e pyarrow.parquet (dependência opcional de tudo que usa Parquet)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("Arquivos Parquet requerem o pacote 'pyarrow' (pip install pyarrow).") from exc
+    return pa, pq
+
+
+def import_csv(csv_path, root=DEFAULT_STORE):
+    """
+    Converte um CSV de remadas para o arquivo de sessões. Sessões já importadas com o
+    mesmo participante e teste são substituídas.
+
+    Returns:
+        list: Chaves (participante, teste) das sessões gravadas.
+    """
+    pa, pq = require_pyarrow()
+    events = load_csv(csv_path)
+    for key in SESSION_KEYS:
+        events[key] = events[key].astype(str)
+
+    table = pa.Table.from_pandas(events[EVENT_COLUMNS], preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root,
+        partition_cols=SESSION_KEYS,
+        existing_data_behavior='delete_matching',
+    )
+    return list(events[SESSION_KEYS].drop_duplicates().itertuples(index=False, name=None))
+
+
+def list_sessions(root=DEFAULT_STORE):
+    """Lista as sessões (participante, teste) do arquivo pelos diretórios, sem ler dados."""
+    sessions = []
+    if not os.path.isdir(root):
+        return sessions
+    participant_key, test_key = SESSION_KEYS
+    for participant_dir in sorted(os.listdir(root)):
+        name, _, participant = participant_dir.partition('=')
+        if name != participant_key:
+            continue
+        for test_dir in sorted(os.listdir(os.path.join(root, participant_dir))):
+            name, _, test = test_dir.partition('=')
+            if name == test_key:
+                sessions.append((unquote(participant), unquote(test)))
+    return sessions
+
+
+def partition_signature(root, participante):
+    """
+    Caminho e data de modificação de cada arquivo das partições de um participante:
+    muda quando as sessões dele são regravadas (chave de cache das leituras).
+    """
+    if not os.path.isdir(root):
+        return ()
+    signature = []
+    # O pyarrow codifica os valores no nome do diretório (espaços, acentos, '/')
+    for participant_dir in os.listdir(root):
+        name, _, participant = participant_dir.partition('=')
+        if name != SESSION_KEYS[0] or unquote(participant) != participante:
+            continue
+        for dirpath, _, filenames in os.walk(os.path.join(root, participant_dir)):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                signature.append((path, os.path.getmtime(path)))
+    return tuple(sorted(signature))
+
+
+def load_sessions(root=DEFAULT_STORE, participants=None, tests=None, columns=None):
+    """
+    Lê sessões do arquivo como tabela de eventos normalizada.
+
+    Args:
+        root (str): Diretório do arquivo de sessões.
+        participants (list): Participantes a ler (padrão: todos).
+        tests (list): Testes a ler (padrão: todos).
+        columns (list): Colunas de eventos a ler além das chaves (padrão: todas).
+
+    Returns:
+        pd.DataFrame: Eventos na ordem de gravação, com as chaves como category.
+    """
+    _, pq = require_pyarrow()
+    filters = []
+    if participants is not None:
+        filters.append((SESSION_KEYS[0], 'in', list(participants)))
+    if tests is not None:
+        filters.append((SESSION_KEYS[1], 'in', list(tests)))
+    if columns is None:
+        columns = EVENT_COLUMNS
+    else:
+        columns = SESSION_KEYS + [column for column in columns if column not in SESSION_KEYS]
+
+    table = pq.read_table(
+        root,
+        columns=columns,
+        filters=filters or None,
+        memory_map=True,
+        partitioning='hive',
+    )
+    events = table.to_pandas()
+    for key in SESSION_KEYS:
+        events[key] = events[key].astype(str).astype('category')
+    return events[columns]
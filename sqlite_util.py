@@ -0,0 +1,18 @@
+"""
+Conexões SQLite compartilhadas pelo cache de resultados e pelo banco de sessões.
+"""
+import sqlite3
+
+
+def connect(path, foreign_keys=False):
+    """
+    Abre uma conexão em modo WAL (vários leitores enquanto um processo grava).
+
+    Os chamadores abrem uma conexão por operação: o Streamlit atende cada sessão em uma
+    thread, e uma conexão sqlite3 não pode ser usada por threads diferentes.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    if foreign_keys:
+        conn.execute('PRAGMA foreign_keys=ON')
+    return conn
@@ -0,0 +1,175 @@
+"""
+Estatísticas do grupo: intervalos de confiança por bootstrap e tamanho de efeito
+pareado do Pré para o Pós-Teste, para cada métrica e trecho.
+
+A entrada é a tabela longa de calculate_metrics_batch (uma linha por participante,
+teste e trecho). Cada reamostragem sorteia atletas com reposição e é representada
+pelo número de vezes que cada atleta foi sorteado; assim todas as reamostragens de
+todas as métricas e trechos saem de um único produto de matrizes
+(reamostragens x atletas) @ (atletas x células), sem laços em Python.
+"""
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from stroke_metrics import NUMERIC_METRICS, SESSION_KEYS
+
+COMPARISON_COLUMNS = [
+    'Trecho',
+    'Métrica',
+    'Atletas',
+    'Pré',
+    'Pós',
+    'Diferença',
+    'IC inf',
+    'IC sup',
+    'd_z',
+    'd_z IC inf',
+    'd_z IC sup',
+]
+
+# Reamostragens por bloco: limita a memória das matrizes reamostragem x célula
+BATCH_RESAMPLES = 2000
+
+
+def duplicate_sessions(table):
+    """
+    Pares (participante, teste) com mais de uma sessão na tabela longa (p. ex. o mesmo
+    teste enviado em dois arquivos).
+
+    Returns:
+        pd.DataFrame: Colunas SESSION_KEYS e 'Sessões' (quantidade de sessões do par).
+    """
+    sessions = table.groupby(SESSION_KEYS + ['Trecho'], observed=True, sort=False).size()
+    sessions = sessions.groupby(level=SESSION_KEYS, observed=True, sort=False).max()
+    return sessions[sessions > 1].rename('Sessões').reset_index()
+
+
+def athlete_matrix(table, test, metrics=NUMERIC_METRICS):
+    """
+    Matriz atleta x (métrica, trecho) de um teste. Se o atleta tem mais de uma sessão
+    do teste (ver duplicate_sessions), vale a média das sessões em cada trecho.
+
+    Returns:
+        pd.DataFrame: Índice 'Participante' e colunas MultiIndex (métrica, trecho) na
+        ordem de aparição dos trechos; NaN onde o atleta não tem o trecho.
+    """
+    rows = table[table['Teste'].astype(str) == test]
+    trechos = pd.unique(table['Trecho'])
+    wide = rows.pivot_table(index='Participante', columns='Trecho', values=list(metrics), aggfunc='mean', observed=True)
+    return wide.reindex(columns=pd.MultiIndex.from_product([list(metrics), trechos]))
+
+
+def resample_weights(rng, n_athletes, n_resamples):
+    """Quantas vezes cada atleta entra em cada reamostragem (matriz reamostragens x atletas)."""
+    return rng.multinomial(n_athletes, np.full(n_athletes, 1 / n_athletes), size=n_resamples).astype(float)
+
+
+def weighted_moments(weights, values):
+    """
+    Média, desvio padrão amostral e número de valores de cada coluna de `values`
+    (atletas x células, NaN = ausente) para cada linha de pesos (reamostragem).
+    """
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    count = weights @ present
+    total = weights @ filled
+    squares = weights @ (filled * filled)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        var = (squares - total * mean) / (count - 1)
+    return mean, np.sqrt(np.maximum(var, 0)), count
+
+
+def _bootstrap_block(task):
+    differences, n_resamples, seed, quantiles = task
+    n_athletes = differences.shape[0]
+    means, effects = [], []
+    # Mesma semente em todos os blocos de células: as reamostragens são as mesmas
+    # para todas as métricas, com ou sem processos
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_resamples, BATCH_RESAMPLES):
+        size = min(BATCH_RESAMPLES, n_resamples - start)
+        weights = resample_weights(rng, n_athletes, size)
+        mean, sd, _ = weighted_moments(weights, differences)
+        means.append(mean)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            effects.append(mean / sd)
+    means = np.concatenate(means)
+    effects = np.concatenate(effects)
+    # Células sem variação (ou com um só atleta) não têm d_z: quantis NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean_ci = np.nanquantile(means, quantiles, axis=0)
+        effect_ci = np.nanquantile(np.where(np.isfinite(effects), effects, np.nan), quantiles, axis=0)
+    return mean_ci, effect_ci
+
+
+def bootstrap_paired(table, metrics=NUMERIC_METRICS, pre='Pre', pos='Pos', n_resamples=10_000,
+                     confidence=0.95, seed=0, max_workers=1):
+    """
+    Diferença pareada Pós - Pré de cada métrica e trecho entre os atletas com os dois
+    testes, com IC por bootstrap (percentil) da diferença média e do tamanho de efeito
+    d_z (diferença média / desvio padrão das diferenças). Sessões repetidas do mesmo
+    teste entram pela média (ver athlete_matrix).
+
+    Args:
+        table (pd.DataFrame): Tabela longa de calculate_metrics_batch.
+        metrics (list): Métricas a comparar (padrão: todas).
+        pre, pos (str): Rótulos dos testes na coluna 'Teste'.
+        n_resamples (int): Número de reamostragens.
+        confidence (float): Nível de confiança dos intervalos.
+        seed (int): Semente das reamostragens (o resultado não depende de max_workers).
+        max_workers (int): Processos para dividir as métricas (padrão: 1, no próprio
+            processo; None usa todos os núcleos).
+
+    Returns:
+        pd.DataFrame: Uma linha por (trecho, métrica) com as colunas de COMPARISON_COLUMNS.
+    """
+    before = athlete_matrix(table, pre, metrics)
+    after = athlete_matrix(table, pos, metrics)
+    athletes = before.index.intersection(after.index)
+    columns = before.columns
+    before = before.loc[athletes].to_numpy(dtype=float)
+    after = after.loc[athletes].to_numpy(dtype=float)
+    differences = after - before
+    if len(athletes) == 0:
+        return pd.DataFrame(columns=COMPARISON_COLUMNS)
+
+    alpha = (1 - confidence) / 2
+    quantiles = [alpha, 1 - alpha]
+    workers = max_workers or os.cpu_count() or 1
+    blocks = np.array_split(np.arange(differences.shape[1]), min(workers, differences.shape[1]))
+    tasks = [(differences[:, block], n_resamples, seed, quantiles) for block in blocks]
+    if workers == 1:
+        parts = [_bootstrap_block(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_bootstrap_block, tasks))
+    mean_ci = np.concatenate([part[0] for part in parts], axis=1)
+    effect_ci = np.concatenate([part[1] for part in parts], axis=1)
+
+    one = np.ones((1, len(athletes)))
+    mean, sd, count = weighted_moments(one, differences)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        effect = mean / sd
+    pre_mean = weighted_moments(one, np.where(np.isnan(differences), np.nan, before))[0]
+    pos_mean = weighted_moments(one, np.where(np.isnan(differences), np.nan, after))[0]
+
+    result = pd.DataFrame({
+        'Trecho': columns.get_level_values(1),
+        'Métrica': columns.get_level_values(0),
+        'Atletas': count[0].astype(int),
+        'Pré': pre_mean[0],
+        'Pós': pos_mean[0],
+        'Diferença': mean[0],
+        'IC inf': mean_ci[0],
+        'IC sup': mean_ci[1],
+        'd_z': np.where(np.isfinite(effect[0]), effect[0], np.nan),
+        'd_z IC inf': effect_ci[0],
+        'd_z IC sup': effect_ci[1],
+    })
+    return result[result['Atletas'] > 0].reset_index(drop=True)
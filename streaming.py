@@ -0,0 +1,297 @@
+"""
+Ingestão incremental do registro de eventos, para sessões ao vivo e logs longos.
+
+Cada sessão mantém acumuladores por trecho (contagens, ciclos, tempos de passagem e
+fases) e um estado mínimo entre blocos: o último evento (para o intervalo que atravessa
+a fronteira entre blocos), até três eventos de um ciclo ainda não decidido e o contexto
+da validação e da série por remada. Processar um bloco custa O(eventos novos); além
+dos acumuladores, só a série por remada e o relatório de anomalias crescem com o
+registro.
+"""
+import copy
+import io
+
+import numpy as np
+import pandas as pd
+
+from stroke_metrics import (
+    ANOMALY_COLUMNS,
+    SESSION_KEYS,
+    STROKE_COLUMNS,
+    anomaly_report,
+    check_events,
+    clean_mask,
+    complete_events,
+    count_strokes_by_trecho,
+    cycles_per_trecho,
+    decide_cycle_pairs,
+    interpolate_split_times,
+    last_complete_events,
+    metrics_from_aggregates,
+    normalize_events,
+    phase_times_by_trecho,
+    stroke_series,
+    summarize_phase_times,
+)
+
+COUNT_COLUMNS = ['Eventos', 'Remadas', 'Rem Esq', 'Rem Dir']
+
+
+def _compact(frames):
+    if len(frames) > 1:
+        frames[:] = [pd.concat(frames, ignore_index=True)]
+
+
+class SessionAccumulator:
+    """
+    Métricas de uma sessão (participante x teste) atualizadas bloco a bloco. Ao final,
+    results() coincide com compute_session_results sobre a sessão completa.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.n_events = 0
+        self.counts = np.zeros((grid.n_segments, len(COUNT_COLUMNS)), dtype=np.int64)
+        self.phase_sums = np.zeros((grid.n_segments, 2))
+        self.cycles = 0
+        self.ciclos = np.zeros(grid.n_segments, dtype=np.int64)
+        self.split_times = np.full(grid.n_segments + 1, np.nan)  # inícios dos trechos e chegada
+        self.finish_time = None  # tempo pela marcação exata da chegada (NaN se anulado)
+
+        # Estado carregado entre blocos
+        self._last_event = None   # (tempo, distância, ação) do último evento
+        self._last_valid = None   # (distância, tempo) do último evento com dados completos
+        self._pending = None      # eventos de um par/ciclo ainda não decidido (até 3)
+        self._held = None         # eventos desde o último completo, validados só quando chegar o seguinte
+        self._validated = None    # últimos eventos completos já validados (contexto)
+        self._max_time = -np.inf  # maior tempo entre os eventos limpos já validados
+        self._anomalies = []
+        self._strokes = []
+        self._stroke_context = None  # últimos eventos completos (remadas que cruzam blocos)
+        self.n_strokes = 0
+
+    def update(self, chunk):
+        """Incorpora um bloco de eventos da sessão (tabela normalizada, em ordem)."""
+        if chunk.empty:
+            return
+        # A validação do último evento completo depende do completo seguinte (ver
+        # check_events): ele e os eventos depois dele esperam o próximo bloco
+        if self._held is not None:
+            chunk = pd.concat([self._held, chunk])
+        complete = np.flatnonzero(complete_events(chunk))
+        keep = complete[-1] if len(complete) else len(chunk)
+        flags = check_events(chunk, previous=self._validated, max_time=self._max_time)
+        self._held = chunk.iloc[keep:] if keep < len(chunk) else None
+        self._incorporate(chunk.iloc[:keep], {rule: mask[:keep] for rule, mask in flags.items()})
+
+    def _flush(self):
+        flags = check_events(self._held, previous=self._validated, max_time=self._max_time)
+        held, self._held = self._held, None
+        self._incorporate(held, flags)
+
+    def _incorporate(self, chunk, flags):
+        if chunk.empty:
+            return
+        report = anomaly_report(chunk, flags)
+        if not report.empty:
+            self._anomalies.append(report)
+        previous = chunk if self._validated is None else pd.concat([self._validated, chunk])
+        self._validated = last_complete_events(previous)
+
+        # Eventos com erro não formam intervalos de tempo (ver apply_clean_mask)
+        times = np.where(clean_mask(flags), chunk['t_seconds'].to_numpy(), np.nan)
+        if not np.isnan(times).all():
+            self._max_time = max(self._max_time, np.nanmax(times))
+        self._update_strokes(chunk.assign(t_seconds=times))
+        distances = chunk['distance'].to_numpy(dtype=float)
+        actions = chunk['action'].to_numpy()
+        sides = chunk['side'].to_numpy()
+
+        counts = count_strokes_by_trecho(chunk, self.grid)
+        self.counts += counts[COUNT_COLUMNS].to_numpy(dtype=np.int64)
+
+        self._update_phases(times, distances, actions)
+        self._update_splits(times, distances)
+        self._update_cycles(actions, sides, distances)
+        self._last_event = (times[-1], distances[-1], actions[-1])
+        self.n_events += len(chunk)
+
+    def _update_strokes(self, events):
+        context = 0
+        if self._stroke_context is not None:
+            context = len(self._stroke_context)
+            events = pd.concat([self._stroke_context, events])
+        strokes = stroke_series(events, first_stroke=self.n_strokes + 1, context=context)
+        if not strokes.empty:
+            self._strokes.append(strokes)
+            self.n_strokes += len(strokes)
+        self._stroke_context = last_complete_events(events)
+
+    def _update_phases(self, times, distances, actions):
+        if self._last_event is not None:
+            last_time, last_distance, last_action = self._last_event
+            times = np.concatenate([[last_time], times])
+            distances = np.concatenate([[last_distance], distances])
+            actions = np.concatenate([[last_action], actions])
+        self.phase_sums += phase_times_by_trecho(times, distances, actions, self.grid)
+
+    def _update_splits(self, times, distances):
+        raw_distances, raw_times = distances, times
+        if self._last_event is not None:
+            raw_times = np.concatenate([[self._last_event[0]], times])
+            raw_distances = np.concatenate([[self._last_event[1]], distances])
+
+        # Chegada: evento anterior à última marcação exata da distância final
+        finish_rows = np.flatnonzero(raw_distances[1:] == self.grid.finish)
+        if len(finish_rows):
+            self.finish_time = raw_times[finish_rows[-1]]
+
+        if self._last_valid is not None:
+            distances = np.concatenate([[self._last_valid[0]], distances])
+            times = np.concatenate([[self._last_valid[1]], times])
+        valid = ~(np.isnan(distances) | np.isnan(times))
+        if valid.any():
+            self._last_valid = (distances[valid][-1], times[valid][-1])
+
+        pending = np.flatnonzero(np.isnan(self.split_times))
+        if len(pending):
+            checkpoints = self.grid.bounds[pending]
+            self.split_times[pending] = interpolate_split_times(distances, times, checkpoints)
+
+    def _update_cycles(self, actions, sides, distances):
+        if self._pending is not None:
+            actions = np.concatenate([self._pending[0], actions])
+            sides = np.concatenate([self._pending[1], sides])
+            distances = np.concatenate([self._pending[2], distances])
+
+        # Só os pares com um par seguinte completo podem ser decididos agora
+        n_pairs = len(actions) // 2
+        taken = decide_cycle_pairs(actions, sides)
+        if n_pairs >= 2:
+            starts = 2 * np.flatnonzero(taken)
+            self.cycles += len(starts)
+            self.ciclos += cycles_per_trecho(distances[starts], distances[starts + 3], self.grid)
+
+            # Um ciclo no último par decidido consome também o par seguinte
+            keep_from = 2 * (n_pairs - 1 + int(taken[-1]))
+        else:
+            keep_from = 0
+        self._pending = (actions[keep_from:], sides[keep_from:], distances[keep_from:])
+
+    def results(self):
+        """Resultados atuais no mesmo formato de compute_session_results."""
+        # Os blocos acumulados viram um só frame, para que a próxima chamada junte
+        # apenas os blocos novos
+        _compact(self._anomalies)
+        _compact(self._strokes)
+        if self._held is None:
+            return self._results()
+        # Sem o evento seguinte, os eventos retidos são validados como fim do registro,
+        # em uma cópia rasa: só os agregados por trecho são copiados e os frames
+        # acumulados são compartilhados
+        session = copy.copy(self)
+        for name in ('counts', 'phase_sums', 'ciclos', 'split_times'):
+            setattr(session, name, getattr(self, name).copy())
+        session._anomalies = list(self._anomalies)
+        session._strokes = list(self._strokes)
+        session._flush()
+        return session._results()
+
+    def _results(self):
+        grid = self.grid
+        counts = pd.DataFrame(self.counts, columns=COUNT_COLUMNS, index=grid.labels)
+        trecho_ciclos = {label: int(count) for label, count in zip(grid.labels, self.ciclos)}
+
+        estimated_times = {
+            pos: (None if np.isnan(value) else value)
+            for pos, value in zip(grid.edges, self.split_times)
+        }
+        # Sem a marcação ou com o tempo dela anulado, vale o tempo interpolado
+        if self.finish_time is not None and not np.isnan(self.finish_time):
+            estimated_times[grid.finish] = self.finish_time
+
+        phases = summarize_phase_times(self.phase_sums, grid)
+        metrics, totais = metrics_from_aggregates(grid, counts, trecho_ciclos, estimated_times, phases)
+        anomalies = (
+            pd.concat(self._anomalies, ignore_index=True) if self._anomalies
+            else pd.DataFrame(columns=ANOMALY_COLUMNS)
+        )
+        strokes = (
+            pd.concat(self._strokes, ignore_index=True) if self._strokes
+            else pd.DataFrame(columns=STROKE_COLUMNS)
+        )
+        return {
+            'metrics': metrics,
+            'totais': totais,
+            'splits': estimated_times,
+            'anomalies': anomalies,
+            'strokes': strokes,
+        }
+
+
+class StreamingIngestor:
+    """Distribui blocos de eventos entre os acumuladores de cada sessão."""
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.sessions = {}
+
+    def update(self, events):
+        """Incorpora um bloco da tabela de eventos normalizada (pode conter várias sessões)."""
+        for keys, chunk in events.groupby(SESSION_KEYS, observed=True, sort=False):
+            if keys not in self.sessions:
+                self.sessions[keys] = SessionAccumulator(self.grid)
+            self.sessions[keys].update(chunk)
+
+    def results(self):
+        """Resultados atuais de cada sessão, indexados por (participante, teste)."""
+        return {keys: session.results() for keys, session in self.sessions.items()}
+
+
+def read_csv_incremental(path, grid, chunksize=100_000):
+    """Processa um CSV grande em blocos de `chunksize` linhas, sem carregá-lo inteiro."""
+    ingestor = StreamingIngestor(grid)
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        ingestor.update(normalize_events(chunk))
+    return ingestor
+
+
+class CsvTail:
+    """
+    Acompanha um CSV que cresce durante a sessão: cada poll() devolve apenas as linhas
+    completas adicionadas desde a leitura anterior.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.header = None
+        self.rows = 0
+
+    def poll(self, final=False):
+        """
+        Retorna as novas linhas como tabela de eventos normalizada (ou None). A última
+        linha sem quebra de linha pode estar sendo escrita e só é lida com final=True.
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+
+        if not final:
+            data = data[:data.rfind(b'\n') + 1]
+        if not data:
+            return None
+        self.offset += len(data)
+
+        if self.header is None:
+            header_end = data.find(b'\n') + 1 or len(data)
+            self.header, data = data[:header_end], data[header_end:]
+            if not self.header.endswith(b'\n'):
+                self.header += b'\n'
+        if not data.strip():
+            return None
+        raw = pd.read_csv(io.BytesIO(self.header + data))
+        # Índice contínuo entre leituras, como no arquivo completo
+        raw.index += self.rows
+        self.rows += len(raw)
+        return normalize_events(raw)
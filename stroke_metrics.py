@@ -0,0 +1,1036 @@
+"""
+Cálculo das métricas de remada em caiaque a partir do registro de eventos.
+
+Este módulo não depende do Streamlit nem do Plotly: pode ser importado em notebooks,
+scripts e no cli.py sem o custo de inicialização da interface (app.py).
+"""
+import contextvars
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from metrics_cache import DEFAULT_MAX_BYTES, DEFAULT_PATH, MetricsCache
+from profiling import profiled, stage
+
+# Colunas das tabelas de métricas por trecho e totais
+METRIC_COLUMNS = [
+    'Trecho',
+    'Ciclos',
+    'Remadas',
+    'Rem Esq',
+    'Rem Dir',
+    '% Rem Esq',
+    '% Rem Dir',
+    'Vel Média (m/s)',
+    'Freq de Rem (r/min)',
+    'Comp Médio Rem (m/remada)',
+    'Índice de Remada',
+    'Freq de Ciclo (r/min)',
+    'Comp Médio Ciclo (m/ciclo)',
+    'Índice de Ciclo',
+    'Tempo (s)',
+    'Fase aérea',
+    'Fase aquática',
+    'Fase aérea %',
+    'Fase aquática %',
+]
+
+# Colunas numéricas das tabelas de métricas (gravadas no banco e comparadas no grupo)
+NUMERIC_METRICS = METRIC_COLUMNS[1:]
+
+
+# Grade de trechos da prova: limites a cada `step` metros até a distância final
+# (0 < step <= distance)
+@dataclass(frozen=True)
+class SegmentGrid:
+    distance: float = 200
+    step: float = 25
+
+    def __post_init__(self):
+        if not (np.isfinite(self.distance) and self.distance > 0):
+            raise ValueError(f'Distância da prova inválida: {self.distance!r} (deve ser maior que zero).')
+        if not 0 < self.step <= self.distance:
+            raise ValueError(
+                f'Tamanho do trecho inválido: {self.step!r} (deve ser maior que zero e no máximo a distância da prova).'
+            )
+
+    @cached_property
+    def edges(self):
+        edges = [_as_number(pos) for pos in np.arange(0, self.distance, self.step)]
+        return tuple(edges + [_as_number(self.distance)])
+
+    @cached_property
+    def bounds(self):
+        return np.asarray(self.edges, dtype=float)
+
+    @property
+    def starts(self):
+        return self.edges[:-1]
+
+    @property
+    def ends(self):
+        return self.edges[1:]
+
+    @property
+    def n_segments(self):
+        return len(self.edges) - 1
+
+    @cached_property
+    def labels(self):
+        return [f'{start:g}-{end:g}m' for start, end in zip(self.starts, self.ends)]
+
+    @property
+    def total_label(self):
+        return f'0-{_as_number(self.distance):g}m'
+
+    @property
+    def finish(self):
+        return self.edges[-1]
+
+    def locate(self, distances):
+        """
+        Índice do trecho de cada distância por busca binária nos limites (O(log k) por
+        evento). A linha de chegada pertence ao último trecho; distâncias fora da prova
+        ou ausentes retornam -1.
+        """
+        distances = np.asarray(distances, dtype=float)
+        idx = np.searchsorted(self.bounds, distances, side='right') - 1
+        idx[distances == self.bounds[-1]] = self.n_segments - 1
+        idx[(idx < 0) | (idx >= self.n_segments) | np.isnan(distances)] = -1
+        return idx
+
+
+def _as_number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+# Códigos inteiros das colunas de texto usadas nos cálculos (-1 = valor desconhecido)
+ACTION_CODES = {'Entrada': 0, 'Saida': 1}
+SIDE_CODES = {'Esquerda': 0, 'Direita': 1}
+ENTRADA = ACTION_CODES['Entrada']
+SAIDA = ACTION_CODES['Saida']
+ESQUERDA = SIDE_CODES['Esquerda']
+DIREITA = SIDE_CODES['Direita']
+
+
+# Tempo decorrido (s) de cada evento, calculado de uma vez para todo o DataFrame
+def elapsed_seconds(df):
+    return (
+        df['Min'].to_numpy(dtype=float) * 60 +
+        df['Segundo'].to_numpy(dtype=float) +
+        df['Milesimos'].to_numpy(dtype=float) / 1000
+    )
+
+
+def _encode(column, codes):
+    return column.map(codes).fillna(-1).to_numpy(dtype=np.int8)
+
+
+@profiled()
+def normalize_events(raw):
+    """
+    Converte o registro bruto (formato do lb.csv) na tabela de eventos usada por todas
+    as funções de métricas: uma coluna tipada por informação, sem texto nos cálculos.
+
+    Args:
+        raw (pd.DataFrame): DataFrame lido do CSV de remadas.
+
+    Returns:
+        pd.DataFrame: Tabela com as colunas
+            - 'Participante', 'Teste' (category): chaves da sessão;
+            - 't_seconds' (float64): tempo decorrido do evento;
+            - 'distance' (float32): distância percorrida;
+            - 'action' (int8): código da ação (ver ACTION_CODES);
+            - 'side' (int8): código do lado da pá (ver SIDE_CODES).
+    """
+    distance = raw['Distância']
+    if not pd.api.types.is_numeric_dtype(distance):
+        distance = pd.to_numeric(distance.astype(str).str.replace(',', '.'), errors='coerce')
+
+    return pd.DataFrame({
+        'Participante': raw['Participante'].astype('category'),
+        'Teste': raw['Teste'].astype('category'),
+        't_seconds': elapsed_seconds(raw),
+        'distance': distance.to_numpy(dtype=np.float32),
+        'action': _encode(raw['Ação'], ACTION_CODES),
+        'side': _encode(raw['Pá do remo'], SIDE_CODES),
+    }, index=raw.index)
+
+
+# Regras de validação dos eventos: gravidade e descrição. Eventos com gravidade
+# 'erro' não formam intervalos de tempo (tempos de passagem e fases); 'aviso' apenas
+# aparece no relatório.
+ERRO = 'erro'
+AVISO = 'aviso'
+VALIDATION_RULES = {
+    'tempo_ausente': (ERRO, 'Tempo (Min/Segundo/Milesimos) ausente ou inválido'),
+    'distancia_ausente': (ERRO, 'Distância ausente ou inválida'),
+    'distancia_negativa': (ERRO, 'Distância negativa'),
+    'acao_desconhecida': (ERRO, "Ação diferente de 'Entrada' ou 'Saida'"),
+    'tempo_recuando': (ERRO, 'Tempo menor que o do evento anterior'),
+    'distancia_recuando': (AVISO, 'Distância menor que a do evento anterior'),
+    'acao_repetida': (AVISO, 'Mesma ação do evento anterior (fase não registrada)'),
+    'lado_desconhecido': (AVISO, "Pá do remo diferente de 'Esquerda' ou 'Direita'"),
+}
+ANOMALY_COLUMNS = ['Linha', 'Regra', 'Gravidade']
+
+
+def _complete_events(times, distances, actions):
+    return ~(np.isnan(times) | np.isnan(distances) | (distances < 0) | (actions < 0))
+
+
+def complete_events(df):
+    """Máscara dos eventos com tempo, distância e ação válidos."""
+    return _complete_events(
+        df['t_seconds'].to_numpy(dtype=float), df['distance'].to_numpy(dtype=float), df['action'].to_numpy()
+    )
+
+
+def last_complete_events(df, n=2):
+    """Os últimos `n` eventos com tempo, distância e ação válidos (contexto de check_events)."""
+    return df[complete_events(df)].tail(n)
+
+
+def check_events(df, previous=None, max_time=-np.inf):
+    """
+    Aplica as regras de VALIDATION_RULES a todas as linhas de uma sessão de uma vez.
+
+    As comparações com o evento anterior consideram só eventos completos (com tempo,
+    distância e ação válidos). Um evento recua no tempo quando é anterior ao maior
+    tempo já visto entre os eventos anteriores, de modo que um bloco inteiro deslocado
+    para trás é marcado e não só a sua primeira linha. A exceção é o pico isolado: um
+    evento adiantado cuja remoção restaura a ordem é o culpado, e fica fora do máximo.
+    Como o pico depende do evento completo seguinte, a decisão sobre o último evento
+    completo supõe que não há evento seguinte.
+
+    Args:
+        df (pd.DataFrame): Tabela de eventos normalizada de uma sessão, em ordem.
+        previous (pd.DataFrame): Eventos já validados que antecedem `df` (só os dois
+            últimos completos são usados), para validar um registro em blocos.
+        max_time (float): Maior tempo entre os eventos limpos já validados antes de
+            `df` (validação em blocos).
+
+    Returns:
+        dict: Máscara booleana (uma posição por linha de `df`) de cada regra.
+    """
+    times = df['t_seconds'].to_numpy(dtype=float)
+    distances = df['distance'].to_numpy(dtype=float)
+    actions = df['action'].to_numpy()
+    flags = {
+        'tempo_ausente': np.isnan(times),
+        'distancia_ausente': np.isnan(distances),
+        'distancia_negativa': distances < 0,
+        'acao_desconhecida': actions < 0,
+        'lado_desconhecido': df['side'].to_numpy() < 0,
+    }
+
+    # Eventos completos, precedidos dos últimos eventos completos do bloco anterior
+    rows = np.flatnonzero(_complete_events(times, distances, actions))
+    t, d, a = times[rows], distances[rows], actions[rows]
+    n_previous = 0
+    if previous is not None:
+        previous = last_complete_events(previous)
+        n_previous = len(previous)
+        t = np.concatenate([previous['t_seconds'].to_numpy(dtype=float), t])
+        d = np.concatenate([previous['distance'].to_numpy(dtype=float), d])
+        a = np.concatenate([previous['action'].to_numpy(), a])
+
+    def mark(positions):
+        # Posições nos arrays com contexto -> máscara sobre as linhas de df
+        positions = positions[positions >= n_previous] - n_previous
+        mask = np.zeros(len(df), dtype=bool)
+        mask[rows[positions]] = True
+        return mask
+
+    # O contexto já está no máximo recebido (max_time); só os eventos de df entram
+    spike = np.zeros(len(t), dtype=bool)
+    spike[1:-1] = (t[1:-1] > t[2:]) & (t[:-2] <= t[2:])
+    spike[:n_previous] = False
+    seen = np.where(spike, -np.inf, t)
+    seen[:n_previous] = -np.inf
+    seen = np.maximum.accumulate(np.concatenate([[max_time], seen]))[:-1]
+    flags['tempo_recuando'] = mark(np.flatnonzero(spike | (t < seen)))
+    flags['distancia_recuando'] = mark(np.flatnonzero(d[1:] < d[:-1]) + 1)
+    flags['acao_repetida'] = mark(np.flatnonzero(a[1:] == a[:-1]) + 1)
+    return {rule: flags[rule] for rule in VALIDATION_RULES}
+
+
+def clean_mask(flags):
+    """Eventos sem nenhuma regra de gravidade 'erro' (os que formam intervalos de tempo)."""
+    errors = [flags[rule] for rule, (severity, _) in VALIDATION_RULES.items() if severity == ERRO]
+    return ~np.logical_or.reduce(errors)
+
+
+def anomaly_report(df, flags):
+    """Relatório com uma linha por (evento, regra violada), ordenado pela linha do registro."""
+    parts = []
+    for rule, mask in flags.items():
+        positions = np.flatnonzero(mask)
+        if len(positions):
+            parts.append(pd.DataFrame({
+                'Linha': df.index[positions],
+                'Regra': rule,
+                'Gravidade': VALIDATION_RULES[rule][0],
+            }))
+    if not parts:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS)
+    return pd.concat(parts, ignore_index=True).sort_values('Linha', kind='stable', ignore_index=True)
+
+
+@profiled()
+def validate_events(df):
+    """
+    Valida uma sessão completa antes das funções de métricas.
+
+    Returns:
+        np.ndarray: Máscara dos eventos limpos (sem erros); ver apply_clean_mask.
+        pd.DataFrame: Relatório de anomalias (Linha, Regra, Gravidade); 'Linha' é o
+        índice do evento na tabela (0 = primeira linha de dados do CSV).
+    """
+    flags = check_events(df)
+    return clean_mask(flags), anomaly_report(df, flags)
+
+
+def apply_clean_mask(df, clean):
+    """
+    Anula (NaN) o tempo dos eventos fora da máscara: eles deixam de formar intervalos
+    nos tempos de passagem e nas fases, mas continuam na sequência de ações usada nas
+    contagens e nos ciclos (removê-los deslocaria os pares Entrada/Saida).
+    """
+    if clean.all():
+        return df
+    return df.assign(t_seconds=np.where(clean, df['t_seconds'].to_numpy(), np.nan))
+
+
+def interpolate_split_times(distances, times, checkpoints):
+    """
+    Interpola o tempo de passagem em cada ponto de controle a partir dos arrays de
+    distância e tempo dos eventos, em uma única chamada vetorizada.
+
+    O tempo em um ponto é interpolado no primeiro intervalo em que o remador avança
+    sobre ele. Linhas com distância recuando (não monotônicas) ou ausente (NaN) não
+    formam intervalos válidos e são ignoradas.
+
+    Args:
+        distances (array-like): Distância de cada evento, na ordem do registro.
+        times (array-like): Tempo decorrido (s) de cada evento.
+        checkpoints (array-like): Posições em que se deseja o tempo de passagem.
+
+    Returns:
+        np.ndarray: Tempo estimado para cada ponto (NaN se o ponto não foi alcançado).
+    """
+    distances = np.asarray(distances, dtype=float)
+    times = np.asarray(times, dtype=float)
+    checkpoints = np.asarray(checkpoints, dtype=float)
+
+    valid = ~(np.isnan(distances) | np.isnan(times))
+    distances = distances[valid]
+    times = times[valid]
+
+    estimated = np.full(len(checkpoints), np.nan)
+    if len(distances) == 0:
+        return estimated
+
+    prev = np.full(len(checkpoints), -1)
+
+    # Pontos à frente da largada: o primeiro evento que alcança o ponto fecha o
+    # primeiro intervalo que o contém
+    reached = np.maximum.accumulate(distances)
+    ahead = checkpoints > distances[0]
+    idx = np.searchsorted(reached, checkpoints[ahead], side='left')
+    prev[ahead] = np.where(idx < len(distances), idx - 1, -1)
+
+    # Pontos sobre ou atrás da largada (raros): busca direta do primeiro intervalo
+    # de avanço que os contém
+    forward = distances[:-1] < distances[1:]
+    for k in np.flatnonzero(~ahead):
+        covers = forward & (distances[:-1] <= checkpoints[k]) & (checkpoints[k] <= distances[1:])
+        if covers.any():
+            prev[k] = np.argmax(covers)
+
+    inside = prev >= 0
+    start = prev[inside]
+    end = start + 1
+    estimated[inside] = (
+        times[start] +
+        (checkpoints[inside] - distances[start]) * (times[end] - times[start]) / (distances[end] - distances[start])
+    )
+    return estimated
+
+
+# Função para estimar tempos nos pontos de interesse
+@profiled()
+def estimate_time_at_positions(df, positions, finish):
+    distances = df['distance'].to_numpy(dtype=float)
+    times = df['t_seconds'].to_numpy()
+
+    estimated = interpolate_split_times(distances, times, list(positions) + [finish])
+    estimated_times = {
+        pos: (None if np.isnan(value) else value)
+        for pos, value in zip(positions, estimated[:-1])
+    }
+
+    # Tempo de chegada: evento anterior à última marcação exata da distância final;
+    # sem a marcação (prova mais longa que a grade, registro incompleto) ou com o tempo
+    # desse evento anulado (ver apply_clean_mask), o tempo interpolado na chegada, ou
+    # None se ela não foi alcançada
+    finish_rows = np.flatnonzero(distances[1:] == finish)
+    finish_time = times[finish_rows[-1]] if len(finish_rows) else np.nan
+    if np.isnan(finish_time):
+        finish_time = estimated[-1]
+    estimated_times[finish] = None if np.isnan(finish_time) else finish_time
+    return estimated_times
+
+
+def phase_times_by_trecho(times, distances, actions, grid):
+    """
+    Divide o tempo de cada intervalo entre eventos consecutivos entre os trechos que ele
+    atravessa, separado em fase aérea (Saida -> Entrada) e aquática (Entrada -> Saida).
+
+    Returns:
+        np.ndarray: Matriz (trechos x 2) com o tempo das fases aérea e aquática.
+    """
+    bounds = grid.bounds
+    n_trechos = grid.n_segments
+
+    # Classificar todos os pares de eventos consecutivos de uma vez
+    # (0 = fase aérea, 1 = fase aquática); pares que não formam fase ou com tempo
+    # anulado (ver apply_clean_mask) são descartados
+    air = (actions[:-1] == SAIDA) & (actions[1:] == ENTRADA)
+    water = (actions[:-1] == ENTRADA) & (actions[1:] == SAIDA)
+    timed = ~(np.isnan(times[:-1]) | np.isnan(times[1:]))
+    valid = np.flatnonzero((air | water) & timed)
+    phase = water[valid].astype(np.intp)
+
+    start_time = times[valid]
+    end_time = times[valid + 1]
+    start_dist = distances[valid]
+    end_dist = distances[valid + 1]
+    duration = end_time - start_time
+    length = end_dist - start_dist
+
+    # Faixa de trechos com sobreposição positiva para cada intervalo
+    first = np.maximum(np.searchsorted(bounds, start_dist, side='right') - 1, 0)
+    last = np.minimum(np.searchsorted(bounds, end_dist, side='left') - 1, n_trechos - 1)
+    counts = np.where(length > 0, np.maximum(last - first + 1, 0), 0)
+
+    # Matriz de sobreposição intervalo x trecho em formato esparso: uma entrada por
+    # par (intervalo, trecho) que de fato se sobrepõe
+    rows = np.repeat(np.arange(len(valid)), counts)
+    offsets = np.cumsum(counts) - counts
+    trecho_idx = first[rows] + (np.arange(len(rows)) - offsets[rows])
+    overlap = (
+        np.minimum(end_dist[rows], bounds[trecho_idx + 1]) -
+        np.maximum(start_dist[rows], bounds[trecho_idx])
+    )
+    trecho_duration = overlap * duration[rows] / length[rows]
+
+    # Caso o remador permaneça no mesmo trecho sem transição, o tempo todo do
+    # intervalo vai para o trecho atual; intervalos fora de [0, chegada] (p. ex. depois
+    # da chegada em uma prova mais longa que a grade) não entram em nenhum trecho
+    located = grid.locate(start_dist)
+    stay = np.flatnonzero((counts == 0) & (length <= 0) & (located >= 0))
+    stay_idx = located[stay]
+
+    # Uma única redução por (trecho, fase)
+    keys = np.concatenate([trecho_idx * 2 + phase[rows], stay_idx * 2 + phase[stay]])
+    weights = np.concatenate([trecho_duration, duration[stay]])
+    sums = np.bincount(keys, weights=weights, minlength=2 * n_trechos).reshape(n_trechos, 2)
+
+    return sums
+
+
+@profiled()
+def calculate_phases_with_total_times_and_percentages(df, grid, estimated_times):
+    """
+    Calcula o tempo total das fases aérea e aquática, dividindo os tempos entre os trechos,
+    calcula os percentuais de cada fase em cada trecho, além dos totais e percentuais gerais
+    para cada fase (aérea e aquática).
+
+    Args:
+        df (pd.DataFrame): Tabela de eventos normalizada (ver normalize_events).
+        grid (SegmentGrid): Grade de trechos da prova.
+        estimated_times (dict): Dicionário com os tempos estimados para cada posição.
+
+    Returns:
+        tuple: Quatro dicionários contendo:
+            1. Tempo total das fases aérea e aquática por trecho.
+            2. Percentuais das fases aérea e aquática por trecho.
+            3. Tempo total das fases aérea e aquática no total (sem divisão por trecho).
+            4. Percentual total das fases aérea e aquática (sem divisão por trecho).
+    """
+    sums = phase_times_by_trecho(
+        df['t_seconds'].to_numpy(), df['distance'].to_numpy(dtype=float), df['action'].to_numpy(), grid
+    )
+    return summarize_phase_times(sums, grid)
+
+
+def summarize_phase_times(sums, grid):
+    """
+    Monta os tempos e percentuais das fases por trecho e totais (mesma tupla de
+    calculate_phases_with_total_times_and_percentages) a partir da matriz
+    trecho x fase de phase_times_by_trecho.
+    """
+    air_phase_times = dict(zip(grid.starts, sums[:, 0]))
+    water_phase_times = dict(zip(grid.starts, sums[:, 1]))
+
+    # Tempos totais por trecho para o cálculo de percentuais
+    total_trecho_times = dict(zip(grid.starts, sums.sum(axis=1)))
+
+    # Tempos totais gerais
+    total_air_time = sums[:, 0].sum()
+    total_water_time = sums[:, 1].sum()
+    total_time = total_air_time + total_water_time
+
+    # Calcular os percentuais para cada fase em cada trecho
+    air_phase_percentages = {key: (air_phase_times[key] / total_trecho_times[key]) * 100
+                             if total_trecho_times[key] > 0 else 0
+                             for key in air_phase_times}
+    
+    water_phase_percentages = {key: (water_phase_times[key] / total_trecho_times[key]) * 100
+                               if total_trecho_times[key] > 0 else 0
+                               for key in water_phase_times}
+
+    # Calcular os percentuais gerais para as fases
+    total_air_percentage = (total_air_time / total_time) * 100 if total_time > 0 else 0
+    total_water_percentage = (total_water_time / total_time) * 100 if total_time > 0 else 0
+
+    return air_phase_times, water_phase_times, air_phase_percentages, water_phase_percentages, total_air_time, total_water_time, total_air_percentage, total_water_percentage
+
+
+def detect_cycles(action_codes, side_codes):
+    """
+    Detecta os ciclos de remada (uma remada de cada lado, consecutivas) em uma única
+    passada sobre os arrays de eventos codificados.
+
+    A leitura avança sempre de par em par de eventos (Entrada, Saida): um ciclo consome
+    dois pares e qualquer outro par conta como remada perdida. Assim, um par inicia um
+    ciclo quando ele e o seguinte são remadas válidas de lados opostos e ele ocupa uma
+    posição par dentro da sequência contínua de candidatos.
+
+    Args:
+        action_codes (np.ndarray): Código da ação de cada evento (ver ACTION_CODES).
+        side_codes (np.ndarray): Código do lado da pá de cada evento (ver SIDE_CODES).
+
+    Returns:
+        np.ndarray: Índice da linha inicial de cada ciclo.
+        int: Total de remadas perdidas.
+    """
+    n_pairs = len(action_codes) // 2
+    taken = decide_cycle_pairs(action_codes, side_codes)
+
+    cycle_starts = 2 * np.flatnonzero(taken)
+    lost_strokes = n_pairs - 2 * len(cycle_starts)
+    return cycle_starts, int(lost_strokes)
+
+
+def decide_cycle_pairs(action_codes, side_codes):
+    """
+    Para cada par de eventos (linhas 2p, 2p + 1) que tem um par seguinte completo,
+    indica se ele inicia um ciclo, supondo que a leitura chega ao par 0.
+
+    Returns:
+        np.ndarray: Máscara booleana com um valor por par, exceto o último.
+    """
+    n_pairs = len(action_codes) // 2
+    if n_pairs < 2:
+        return np.zeros(0, dtype=bool)
+
+    pair_actions = np.asarray(action_codes[:2 * n_pairs]).reshape(n_pairs, 2)
+    stroke = (pair_actions[:, 0] == ENTRADA) & (pair_actions[:, 1] == SAIDA)
+    pair_sides = np.asarray(side_codes[:2 * n_pairs:2])
+
+    candidate = stroke[:-1] & stroke[1:] & (pair_sides[:-1] != pair_sides[1:])
+
+    # Posição de cada candidato dentro da sua sequência contínua de candidatos
+    idx = np.arange(len(candidate))
+    run_start = np.maximum.accumulate(np.where(candidate, 0, idx + 1))
+    return candidate & ((idx - run_start) % 2 == 0)
+
+
+def assign_majority_segment(start_dist, end_dist, bounds):
+    """
+    Retorna, para cada intervalo [start_dist, end_dist], o índice do trecho com a maior
+    sobreposição (o primeiro, em caso de empate), ou -1 se não houver sobreposição.
+    Os trechos candidatos são localizados por busca binária nos limites.
+    """
+    start_dist = np.asarray(start_dist, dtype=float)
+    end_dist = np.asarray(end_dist, dtype=float)
+    n_trechos = len(bounds) - 1
+
+    first = np.maximum(np.searchsorted(bounds, start_dist, side='right') - 1, 0)
+    last = np.minimum(np.searchsorted(bounds, end_dist, side='left') - 1, n_trechos - 1)
+    span = last - first + 1
+
+    assigned = np.full(len(start_dist), -1, dtype=np.intp)
+    max_overlap = np.zeros(len(start_dist))
+    for offset in range(int(span.max(initial=0))):
+        active = offset < span
+        trecho = np.minimum(first + offset, n_trechos - 1)
+        overlap = (
+            np.minimum(end_dist, bounds[trecho + 1]) -
+            np.maximum(start_dist, bounds[trecho])
+        )
+        better = active & (overlap > max_overlap)
+        assigned[better] = trecho[better]
+        max_overlap[better] = overlap[better]
+    return assigned
+
+
+def cycles_per_trecho(start_dist, end_dist, grid):
+    """Quantidade de ciclos atribuída a cada trecho (pela maior sobreposição)."""
+    assigned = assign_majority_segment(start_dist, end_dist, grid.bounds)
+    return np.bincount(assigned[assigned >= 0], minlength=grid.n_segments)
+
+
+@profiled()
+def calculate_cycles_and_lost_strokes(df, grid):
+    """
+    Calcula os ciclos de remada e as remadas perdidas, atribuindo os ciclos aos trechos
+    com base na maior distância percorrida dentro do trecho.
+
+    Args:
+        df (pd.DataFrame): Tabela de eventos normalizada (ver normalize_events).
+        grid (SegmentGrid): Grade de trechos da prova.
+
+    Returns:
+        int: Total de ciclos de remada.
+        int: Total de remadas perdidas.
+        dict: Dicionário com a quantidade de ciclos atribuída a cada trecho.
+    """
+    distances = df['distance'].to_numpy(dtype=float)
+    cycle_starts, lost_strokes = detect_cycles(df['action'].to_numpy(), df['side'].to_numpy())
+    cycles = len(cycle_starts)
+
+    # Atribuir cada ciclo ao trecho com maior sobreposição
+    per_trecho = cycles_per_trecho(distances[cycle_starts], distances[cycle_starts + 3], grid)
+
+    trecho_ciclos = {label: int(count) for label, count in zip(grid.labels, per_trecho)}
+    return cycles, lost_strokes, trecho_ciclos
+
+
+@profiled()
+def count_strokes_by_trecho(df, grid):
+    """
+    Conta, em um único group-by categórico sobre o rótulo do trecho, os eventos, as
+    remadas e as remadas de cada lado em todos os trechos da grade.
+
+    Eventos exatamente sobre um limite interno contam nos dois trechos vizinhos, como
+    no filtro inclusivo [início, fim] usado por trecho.
+
+    Returns:
+        pd.DataFrame: Uma linha por trecho (na ordem da grade) com as colunas
+        'Eventos', 'Remadas', 'Rem Esq' e 'Rem Dir'.
+    """
+    action_codes = df['action'].to_numpy()
+    side_codes = df['side'].to_numpy()
+    distances = df['distance'].to_numpy(dtype=float)
+
+    trecho_idx = grid.locate(distances)
+    on_edge = np.flatnonzero((trecho_idx > 0) & (distances == grid.bounds[np.maximum(trecho_idx, 0)]))
+    rows = np.concatenate([np.arange(len(distances)), on_edge])
+    codes = np.concatenate([trecho_idx, trecho_idx[on_edge] - 1])
+    rows, codes = rows[codes >= 0], codes[codes >= 0]
+
+    remada = action_codes[rows] == SAIDA
+    events = pd.DataFrame({
+        'Trecho': pd.Categorical.from_codes(codes, categories=grid.labels),
+        'Remadas': remada,
+        'Rem Esq': remada & (side_codes[rows] == ESQUERDA),
+        'Rem Dir': remada & (side_codes[rows] == DIREITA),
+    })
+    return events.groupby('Trecho', observed=False).agg(
+        Eventos=('Remadas', 'size'),
+        Remadas=('Remadas', 'sum'),
+        **{'Rem Esq': ('Rem Esq', 'sum'), 'Rem Dir': ('Rem Dir', 'sum')},
+    )
+
+
+def _ratio(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def _derive_metrics(base):
+    """
+    Calcula as colunas derivadas (velocidade, frequências, comprimentos, índices e
+    percentuais) a partir das contagens, distância e tempo de cada linha.
+    """
+    velocidade_media = _ratio(base['Distância'], base['Tempo (s)'])
+    comprimento_remada = _ratio(base['Distância'], base['Remadas'])
+    comprimento_ciclo = _ratio(base['Distância'], base['Ciclos'])
+    derived = pd.DataFrame({
+        'Trecho': base['Trecho'],
+        'Ciclos': base['Ciclos'],
+        'Remadas': base['Remadas'],
+        'Rem Esq': base['Rem Esq'],
+        'Rem Dir': base['Rem Dir'],
+        '% Rem Esq': _ratio(base['Rem Esq'], base['Remadas']) * 100,
+        '% Rem Dir': _ratio(base['Rem Dir'], base['Remadas']) * 100,
+        'Vel Média (m/s)': velocidade_media,
+        'Freq de Rem (r/min)': 60 * _ratio(base['Remadas'], base['Tempo (s)']),
+        'Comp Médio Rem (m/remada)': comprimento_remada,
+        'Índice de Remada': velocidade_media * comprimento_remada,
+        'Freq de Ciclo (r/min)': 60 * _ratio(base['Ciclos'], base['Tempo (s)']),
+        'Comp Médio Ciclo (m/ciclo)': comprimento_ciclo,
+        'Índice de Ciclo': velocidade_media * comprimento_ciclo,
+        'Tempo (s)': base['Tempo (s)'],
+        'Fase aérea': base['Fase aérea'],
+        'Fase aquática': base['Fase aquática'],
+        'Fase aérea %': base['Fase aérea %'],
+        'Fase aquática %': base['Fase aquática %'],
+    })
+    return derived[METRIC_COLUMNS].reset_index(drop=True)
+
+
+@profiled()
+def calculate_metrics_by_trecho(df, grid):
+    """
+    Calcula as métricas de cada trecho e do total da prova a partir de um único
+    agregado por trecho (contagens, ciclos, tempos e fases).
+
+    Args:
+        df (pd.DataFrame): Tabela de eventos normalizada (ver normalize_events).
+        grid (SegmentGrid): Grade de trechos da prova.
+
+    Returns:
+        pd.DataFrame: Métricas por trecho (apenas trechos com dados e percorridos).
+        pd.DataFrame: Métricas totais da prova (uma linha).
+    """
+    total_cycles, total_lost_strokes, trecho_ciclos = calculate_cycles_and_lost_strokes(df, grid)
+    estimated_times = estimate_time_at_positions(df, grid.starts, grid.finish)
+
+    fase_aerea, fase_aquatica, fase_aerea_per, fase_aquatica_per, fase_aerea_total, fase_aquatica_total, fase_aerea_total_per, fase_aquatica_total_per = calculate_phases_with_total_times_and_percentages(df, grid, estimated_times) 
+
+    counts = count_strokes_by_trecho(df, grid)
+    phases = (fase_aerea, fase_aquatica, fase_aerea_per, fase_aquatica_per, fase_aerea_total, fase_aquatica_total, fase_aerea_total_per, fase_aquatica_total_per)
+    return metrics_from_aggregates(grid, counts, trecho_ciclos, estimated_times, phases)
+
+
+def metrics_from_aggregates(grid, counts, trecho_ciclos, estimated_times, phases):
+    """
+    Monta as tabelas `metrics` e `totais` a partir dos agregados por trecho: contagens
+    (count_strokes_by_trecho), ciclos por rótulo, tempos de passagem e a tupla de
+    calculate_phases_with_total_times_and_percentages.
+    """
+    fase_aerea, fase_aquatica, fase_aerea_per, fase_aquatica_per, fase_aerea_total, fase_aquatica_total, fase_aerea_total_per, fase_aquatica_total_per = phases
+
+    tempos = np.array([np.nan if estimated_times[pos] is None else estimated_times[pos] for pos in grid.edges])
+    base = pd.DataFrame({
+        'Trecho': grid.labels,
+        'Ciclos': [trecho_ciclos.get(label, 0) for label in grid.labels],
+        'Remadas': counts['Remadas'].to_numpy(),
+        'Rem Esq': counts['Rem Esq'].to_numpy(),
+        'Rem Dir': counts['Rem Dir'].to_numpy(),
+        'Distância': np.diff(grid.bounds),
+        'Tempo (s)': tempos[1:] - tempos[:-1],
+        'Fase aérea': [fase_aerea[start] for start in grid.starts],
+        'Fase aquática': [fase_aquatica[start] for start in grid.starts],
+        'Fase aérea %': [fase_aerea_per[start] for start in grid.starts],
+        'Fase aquática %': [fase_aquatica_per[start] for start in grid.starts],
+    })
+
+    # Pular trechos sem dados ou não percorridos por completo
+    base = base[(counts['Eventos'].to_numpy() > 0) & ~np.isnan(base['Tempo (s)'].to_numpy())]
+
+    # Totais a partir do mesmo agregado
+    total = pd.DataFrame({
+        column: [base[column].sum()]
+        for column in ['Ciclos', 'Remadas', 'Rem Esq', 'Rem Dir', 'Distância', 'Tempo (s)']
+    })
+    total['Trecho'] = grid.total_label
+    total['Fase aérea'] = fase_aerea_total
+    total['Fase aquática'] = fase_aquatica_total
+    total['Fase aérea %'] = fase_aerea_total_per
+    total['Fase aquática %'] = fase_aquatica_total_per
+
+    return _derive_metrics(base), _derive_metrics(total)
+
+
+# Colunas da série por remada e métricas que podem ser suavizadas
+STROKE_COLUMNS = [
+    'Remada',
+    'Lado',
+    'Tempo (s)',
+    'Distância (m)',
+    'Freq de Rem (r/min)',
+    'Comp Rem (m)',
+    'Vel (m/s)',
+    'Fase aquática (s)',
+    'Fase aérea (s)',
+    'Razão aérea/aquática',
+]
+STROKE_SERIES_METRICS = STROKE_COLUMNS[4:]
+
+
+@profiled()
+def stroke_series(df, first_stroke=1, context=0):
+    """
+    Métricas instantâneas de cada remada completa (Entrada -> Saida -> Entrada
+    seguinte), calculadas de uma vez sobre os eventos com tempo, distância e ação
+    válidos.
+
+    Args:
+        df (pd.DataFrame): Tabela de eventos normalizada de uma sessão, em ordem (com
+            a máscara de apply_clean_mask já aplicada).
+        first_stroke (int): Número da primeira remada na coluna 'Remada'.
+        context (int): Quantidade de eventos iniciais de `df` que são só contexto de
+            um bloco anterior (devem ser eventos completos): remadas que terminam
+            neles não são repetidas.
+
+    Returns:
+        pd.DataFrame: Uma linha por remada com as colunas de STROKE_COLUMNS; 'Tempo (s)'
+        e 'Distância (m)' são os da Entrada que inicia a remada.
+    """
+    times = df['t_seconds'].to_numpy(dtype=float)
+    distances = df['distance'].to_numpy(dtype=float)
+    actions = df['action'].to_numpy()
+    keep = np.flatnonzero(_complete_events(times, distances, actions))
+    t, d, a = times[keep], distances[keep], actions[keep]
+    sides = df['side'].to_numpy()[keep]
+
+    start = np.flatnonzero((a[:-2] == ENTRADA) & (a[1:-1] == SAIDA) & (a[2:] == ENTRADA))
+    start = start[start + 2 >= context]
+    water = t[start + 1] - t[start]
+    air = t[start + 2] - t[start + 1]
+    duration = t[start + 2] - t[start]
+    length = d[start + 2] - d[start]
+
+    return pd.DataFrame({
+        'Remada': np.arange(first_stroke, first_stroke + len(start)),
+        'Lado': pd.Categorical.from_codes(sides[start], categories=list(SIDE_CODES)),
+        'Tempo (s)': t[start],
+        'Distância (m)': d[start],
+        'Freq de Rem (r/min)': _ratio(np.full(len(start), 60.0), duration),
+        'Comp Rem (m)': length,
+        'Vel (m/s)': _ratio(length, duration),
+        'Fase aquática (s)': water,
+        'Fase aérea (s)': air,
+        'Razão aérea/aquática': _ratio(air, water),
+    })
+
+
+def smooth_stroke_series(strokes, window=5, center=True):
+    """
+    Média móvel das métricas por remada (STROKE_SERIES_METRICS).
+
+    Args:
+        strokes (pd.DataFrame): Série de stroke_series.
+        window (int | str): Número de remadas da janela, ou duração no formato do
+            pandas (p. ex. '10s') para uma janela de tempo sobre 'Tempo (s)'.
+            Janelas de 1 remada retornam a série sem alteração.
+        center (bool): Centralizar a janela na remada.
+    """
+    if isinstance(window, str):
+        by_time = strokes.set_index(pd.to_timedelta(strokes['Tempo (s)'], unit='s'))
+        smoothed = by_time[STROKE_SERIES_METRICS].rolling(window, min_periods=1, center=center).mean()
+        values = smoothed.to_numpy()
+    elif window > 1:
+        values = strokes[STROKE_SERIES_METRICS].rolling(window, min_periods=1, center=center).mean().to_numpy()
+    else:
+        return strokes
+    result = strokes.copy()
+    result[STROKE_SERIES_METRICS] = values
+    return result
+
+
+# Colunas que identificam uma sessão na tabela de eventos
+SESSION_KEYS = ['Participante', 'Teste']
+
+
+def with_session_keys(keys, table):
+    """Cópia de `table` com as colunas de SESSION_KEYS à frente, preenchidas com `keys`."""
+    table = table.copy()
+    for position, (name, value) in enumerate(zip(SESSION_KEYS, keys)):
+        table.insert(position, name, value)
+    return table
+
+
+def results_long_table(keys, results):
+    """Tabelas `metrics` e `totais` de uma sessão em formato longo, com as chaves da sessão."""
+    return with_session_keys(keys, pd.concat([results['metrics'], results['totais']], ignore_index=True))
+
+
+def _session_metrics_long(task):
+    keys, session, grid = task
+    return results_long_table(keys, session_results(session, grid))
+
+
+def calculate_metrics_batch(df, grid, max_workers=None):
+    """
+    Calcula as métricas de todas as sessões (participante x teste) da tabela de eventos,
+    distribuindo as sessões entre processos. Cada par (participante, teste) da tabela é
+    uma sessão: tabelas de arquivos diferentes devem ser calculadas separadamente, pois
+    o mesmo teste em dois arquivos viraria uma sessão com os registros sobrepostos.
+
+    Args:
+        df (pd.DataFrame): Tabela de eventos normalizada (ver normalize_events).
+        grid (SegmentGrid): Grade de trechos da prova.
+        max_workers (int): Número de processos (padrão: todos os núcleos). Com 1, ou
+            com uma única sessão, o cálculo é feito no próprio processo.
+
+    Returns:
+        pd.DataFrame: Tabela longa com uma linha por (participante, teste, trecho),
+        incluindo a linha de total de cada sessão (Trecho = grid.total_label).
+    """
+    tasks = [
+        (keys, session, grid)
+        for keys, session in df.groupby(SESSION_KEYS, observed=True, sort=False)
+    ]
+    if not tasks:
+        return pd.DataFrame(columns=SESSION_KEYS + METRIC_COLUMNS)
+
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        tables = [_session_metrics_long(task) for task in tasks]
+    else:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tables = list(pool.map(_session_metrics_long, tasks, chunksize=chunksize))
+    return pd.concat(tables, ignore_index=True)
+
+
+# Versão do código de cálculo: qualquer alteração neste arquivo invalida o cache em disco
+CODE_VERSION = hashlib.sha1(Path(__file__).read_bytes()).hexdigest()[:12]
+
+_metrics_store = None
+
+
+def get_metrics_store():
+    """
+    Cache persistente dos resultados por sessão, aberto no primeiro uso. O local e o
+    tamanho vêm de PARACANUE_CACHE_PATH e PARACANUE_CACHE_MAX_BYTES; com
+    PARACANUE_CACHE_PATH vazio o cache em disco é desativado (retorna None).
+    """
+    global _metrics_store
+    path = os.environ.get('PARACANUE_CACHE_PATH', DEFAULT_PATH)
+    if not path:
+        return None
+    if _metrics_store is None or _metrics_store.path != path:
+        max_bytes = int(os.environ.get('PARACANUE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        _metrics_store = MetricsCache(path, max_bytes)
+    return _metrics_store
+
+
+def load_csv(path):
+    """Lê um CSV de remadas (formato do lb.csv) e retorna a tabela de eventos normalizada."""
+    with stage('read_csv'):
+        raw = pd.read_csv(path)
+    return normalize_events(raw)
+
+
+def read_events(source):
+    """Lê e normaliza um CSV de remadas a partir do caminho ou do conteúdo em bytes."""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return load_csv(source)
+
+
+def iter_csv_files(files, max_workers=None):
+    """
+    Lê e normaliza vários CSVs em paralelo, entregando cada um assim que fica pronto.
+
+    Usa threads: o parser em C do pandas libera o GIL durante a leitura e as tabelas
+    não precisam ser copiadas entre processos. Cada leitura roda em uma cópia do
+    contexto de quem chamou, para que o medidor ativo (profiling.activate) meça as
+    etapas de leitura.
+
+    Args:
+        files (iterable): Pares (nome, caminho ou conteúdo em bytes).
+        max_workers (int): Número de threads (padrão do ThreadPoolExecutor).
+
+    Yields:
+        tuple: (nome, tabela de eventos, erro), na ordem em que terminam; em arquivos
+        que não puderam ser lidos a tabela é None e o erro é a exceção.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, read_events, source): name
+            for name, source in files
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except (OSError, ValueError, KeyError, UnicodeDecodeError) as exc:
+                yield futures[future], None, exc
+
+
+def session_hash(df):
+    """Hash do conteúdo das linhas de uma sessão (independe do índice)."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()
+
+
+@profiled()
+def compute_session_results(df, grid):
+    """
+    Calcula todos os resultados de uma sessão para a grade dada. Os eventos são
+    validados uma vez (validate_events) e a máscara de eventos limpos é aplicada antes
+    dos cálculos (apply_clean_mask).
+
+    Returns:
+        dict: 'metrics' e 'totais' (tabelas de calculate_metrics_by_trecho),
+        'splits' (tempos de passagem de estimate_time_at_positions), 'anomalies'
+        (relatório de validate_events) e 'strokes' (série de stroke_series).
+    """
+    clean, anomalies = validate_events(df)
+    df = apply_clean_mask(df, clean)
+    metrics, totais = calculate_metrics_by_trecho(df, grid)
+    splits = estimate_time_at_positions(df, grid.starts, grid.finish)
+    return {
+        'metrics': metrics,
+        'totais': totais,
+        'splits': splits,
+        'anomalies': anomalies,
+        'strokes': stroke_series(df),
+    }
+
+
+def label_anomaly_rows(results, index):
+    """
+    Resultados com a coluna 'Linha' das anomalias convertida da posição do evento na
+    sessão (como ela fica nos caches) para o índice `index` da tabela de eventos.
+    """
+    anomalies = results['anomalies']
+    if anomalies.empty:
+        return results
+    positions = anomalies['Linha'].to_numpy(dtype=np.intp)
+    return {**results, 'anomalies': anomalies.assign(Linha=index[positions])}
+
+
+@profiled('session_results')
+def stored_session_results(df, grid, session_key=None):
+    """
+    Resultados da sessão a partir do cache persistente em disco; calcula e armazena
+    apenas quando a combinação (dados, grade, versão do código) ainda não existe.
+
+    O hash da sessão não depende do índice, então a mesma sessão lida de outra fonte
+    (ou em outra posição do arquivo) usa a mesma entrada: a 'Linha' das anomalias é a
+    posição do evento na sessão (ver label_anomaly_rows).
+    """
+    if session_key is None:
+        session_key = session_hash(df)
+    # Parâmetros da grade em hexadecimal: exatos, e iguais para 200 e 200.0
+    key = f'{session_key}:{float(grid.distance).hex()}:{float(grid.step).hex()}:{CODE_VERSION}'
+
+    store = get_metrics_store()
+    results = store.get(key) if store is not None else None
+    if results is None:
+        results = compute_session_results(df.reset_index(drop=True), grid)
+        if store is not None:
+            store.put(key, results)
+    return results
+
+
+def session_results(df, grid, session_key=None):
+    """Resultados da sessão (ver stored_session_results), com a 'Linha' das anomalias no índice de `df`."""
+    return label_anomaly_rows(stored_session_results(df, grid, session_key), df.index)